@@ -0,0 +1,362 @@
+"""
+Benchmarks the hot paths from the ECM to the display so that changes to them can be compared across commits.
+
+    python benchmark.py --output before.json
+    python benchmark.py --baseline before.json
+
+Three groups of benchmarks are run:
+    decode: frames per second decoded by Ecm in mock mode and by DecodePlan on a synthetic ride
+    poll: how long begin_poll takes to produce the first frame and how old frames are when live_data hands them over,
+        against an EcmReplay on a pseudo-terminal
+    display: bytes and commands sent per dashboard tick while the render loop drives a GttSimulator.
+        Only this group needs gtt-drivers installed and it is skipped with a warning without it.
+
+The results are printed or written as JSON. Given a baseline from an earlier run, every metric which got worse by
+more than the threshold is reported and the exit status is 1. Throughputs are the best of several runs and latencies
+are medians, but they still depend on the machine, so only compare runs made on the same one.
+Timings on a busy or single core machine can wander by 15% or so between runs, hence the default threshold of 20%.
+"""
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Callable, Dict, List, Sequence
+
+from drivers.decoding import DecodePlan, LiveDataSnapshot
+from drivers.ecm import LIVE_DATA_SAMPLE, Ecm
+from drivers.frame_ring import Frame
+from drivers.live_data_schema import load_live_data_dict
+from drivers.replay import EcmReplay
+
+GROUPS = ('decode', 'poll', 'display')
+# what dashboard.PARAMETERS reads. Repeated here so that only the display group needs gtt-drivers installed.
+PARAMETERS = ['engine_rpm', 'vehicle_speed_mph', 'fuel_pulse_front', 'fuel_pulse_rear', 'DIn']
+RESULTS_VERSION = 1
+HIGHER, LOWER = 'higher', 'lower'  # which way is better for a metric
+
+Results = Dict[str, dict]
+
+
+def add_result(results: Results, name: str, value: float, unit: str, better: str):
+    results[name] = {'value': value, 'unit': unit, 'better': better}
+
+
+def set_scalar(frame: bytearray, param_info: dict, value: float):
+    """Writes a value into a frame the way the ECM would. Only parameters at a single address are supported."""
+    location = param_info['addresses'][0]
+    raw = round((value - param_info['offset']) / param_info['scale_factor'])
+    bits = location['num_bytes'] * 8
+    low, high = (-(1 << bits - 1), (1 << bits - 1) - 1) if param_info['signed'] else (0, (1 << bits) - 1)
+    frame[location['offset']: location['offset'] + location['num_bytes']] = \
+        min(max(raw, low), high).to_bytes(location['num_bytes'], param_info['endianness'], signed=param_info['signed'])
+
+
+def synthetic_frames(live_data_dict: dict, count: int, seed=0) -> List[bytes]:
+    """
+    :return: frames of a made up ride at 10 frames per second which revs up and down through the gears.
+        Everything the dashboard doesn't show is left as it is in LIVE_DATA_SAMPLE.
+    """
+    rng = random.Random(seed)
+    neutral = live_data_dict['DIn']['bits'].index('Neutral Input')
+    neutral_offset = live_data_dict['DIn']['addresses'][0]['offset']
+
+    frames = []
+    for idx in range(count):
+        ride_time = idx / 10
+        speed = max(0.0, 45 + 40 * math.sin(ride_time / 20) + rng.uniform(-1, 1))
+        rpm = 1000 + (speed * 180) % 5500 + rng.uniform(-50, 50) if speed > 3 else 1000 + rng.uniform(-30, 30)
+
+        frame = bytearray(LIVE_DATA_SAMPLE)
+        set_scalar(frame, live_data_dict['engine_rpm'], rpm)
+        set_scalar(frame, live_data_dict['vehicle_speed_mph'], speed)
+        set_scalar(frame, live_data_dict['fuel_pulse_front'], 2 + rpm / 2000)
+        set_scalar(frame, live_data_dict['fuel_pulse_rear'], 2 + rpm / 2000)
+        if speed < 3:
+            frame[neutral_offset] |= 1 << neutral
+        else:
+            frame[neutral_offset] &= ~(1 << neutral) & 0xFF
+        frames.append(bytes(frame))
+
+    return frames
+
+
+def throughput(function: Callable, items: Sequence, repeat=5, min_seconds=0.2) -> float:
+    """:return: the best number of items per second which function got through over repeat runs of min_seconds"""
+    best = 0.0
+    for _ in range(repeat):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            for item in items:
+                function(item)
+            count += len(items)
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+        best = max(best, count / elapsed)
+
+    return best
+
+
+def bench_decode(results: Results, live_data_dict: dict, frames: List[bytes], repeat: int):
+    mock_ecm = Ecm('mock', live_data_dict, mock=True)
+    add_result(results, 'decode.ecm_mock_all', throughput(lambda _: mock_ecm.live_data.to_dict(), range(100), repeat),
+               'frames/s', HIGHER)
+
+    dashboard_ecm = Ecm('mock', live_data_dict, mock=True, parameters=PARAMETERS)
+
+    def read_dashboard_parameters(_):
+        live_data = dashboard_ecm.live_data
+        for name in PARAMETERS:
+            live_data[name]
+
+    add_result(results, 'decode.ecm_mock_dashboard', throughput(read_dashboard_parameters, range(100), repeat),
+               'frames/s', HIGHER)
+
+    plan = DecodePlan(live_data_dict)
+    add_result(results, 'decode.synthetic_all', throughput(plan.decode, frames, repeat), 'frames/s', HIGHER)
+
+    dashboard_plan = DecodePlan({name: live_data_dict[name] for name in PARAMETERS})
+
+    def decode_dashboard_parameters(frame: bytes):
+        live_data = LiveDataSnapshot(frame, dashboard_plan)
+        for name in PARAMETERS:
+            live_data[name]
+
+    add_result(results, 'decode.synthetic_dashboard', throughput(decode_dashboard_parameters, frames, repeat),
+               'frames/s', HIGHER)
+
+    try:
+        from drivers.batch_decoding import BatchDecoder, frames_to_array
+    except ImportError:
+        return  # NumPy isn't installed
+
+    decoder = BatchDecoder(live_data_dict)
+    batch = frames_to_array(frames, len(frames[0]))
+    add_result(results, 'decode.synthetic_batch',
+               throughput(decoder.decode, [batch], repeat) * len(frames), 'frames/s', HIGHER)
+
+
+def bench_poll(results: Results, live_data_dict: dict, frames: List[bytes], repeat: int, seconds: float):
+    """Polls an EcmReplay which answers every request straight away, so only the driver's own overhead is measured"""
+    replay = EcmReplay([Frame(idx + 1, idx / 10, frame) for idx, frame in enumerate(frames)], speed=None)
+    replay.start()
+
+    first_frame_latencies = []
+    handoff_ages = []
+    frame_rates = []
+    try:
+        for _ in range(repeat):
+            ecm = Ecm(replay.port, live_data_dict, parameters=PARAMETERS)
+            start = time.perf_counter()
+            ecm.begin_poll()
+            try:
+                ecm.wait_for_frames(0)
+                first = ecm.live_data
+                first_frame_latencies.append(time.perf_counter() - start)
+
+                # how old each new frame is when live_data first returns it, checking about as often as a busy loop would
+                last_seq = first.seq
+                end = time.monotonic() + seconds
+                while time.monotonic() < end:
+                    live_data = ecm.live_data
+                    if live_data.seq != last_seq:
+                        handoff_ages.append(time.monotonic() - live_data.timestamp)
+                        last_seq = live_data.seq
+                    time.sleep(0.0005)
+
+                frame_rates.append((last_seq - first.seq) / seconds)
+            finally:
+                ecm.end_poll()
+    finally:
+        replay.close()
+
+    add_result(results, 'poll.begin_poll_first_frame', statistics.median(first_frame_latencies), 's', LOWER)
+    add_result(results, 'poll.frames_per_second', max(frame_rates), 'frames/s', HIGHER)
+    if handoff_ages:
+        handoff_ages.sort()
+        add_result(results, 'poll.live_data_age_p50', handoff_ages[len(handoff_ages) // 2], 's', LOWER)
+        add_result(results, 'poll.live_data_age_p99', handoff_ages[int(len(handoff_ages) * 0.99)], 's', LOWER)
+
+
+class SyntheticRide:
+    """Stands in for a polling Ecm. Every read of live_data moves on to the next frame of the ride."""
+
+    def __init__(self, live_data_dict: dict, frames: List[bytes], parameters: Sequence[str]):
+        self.plan = DecodePlan({name: live_data_dict[name] for name in parameters})
+        self.frames = frames
+        self.seq = 0
+
+    @property
+    def live_data(self) -> LiveDataSnapshot:
+        self.seq += 1
+        return LiveDataSnapshot(self.frames[self.seq % len(self.frames)], self.plan, self.seq, time.monotonic())
+
+    @property
+    def health(self) -> str:
+        return 'ok'
+
+    @property
+    def data_age(self) -> float:
+        return 0.0  # every read gets a brand new frame
+
+
+def _wait_until_idle(simulator, quiet=0.1, timeout=5.0):
+    """Waits for the simulator to stop receiving bytes"""
+    end = time.monotonic() + timeout
+    received = -1
+    while simulator.bytes_received != received and time.monotonic() < end:
+        received = simulator.bytes_received
+        time.sleep(quiet)
+
+
+def bench_display(results: Results, live_data_dict: dict, frames: List[bytes], seconds: float):
+    """Runs the dashboard's render loop for real against a simulated display and measures what each tick sends"""
+    try:
+        from dashboard import PARAMETERS as DASHBOARD_PARAMETERS, build_render_loop
+        from display import RooibosDisplay
+        from display.simulator import GttSimulator
+    except ImportError as error:
+        print(f'Skipping the display benchmarks, gtt-drivers is needed for them: {error}', file=sys.stderr)
+        return
+
+    simulator = GttSimulator()
+    display = RooibosDisplay(simulator.serve(), defer_assets=True)
+    try:
+        loop = build_render_loop(display, SyntheticRide(live_data_dict, frames, DASHBOARD_PARAMETERS))
+        _wait_until_idle(simulator)
+        commands_before = len(simulator.commands)
+
+        tick_bytes = []
+        tick_commands = []
+        tick_writes = []
+        tick_durations = []
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            ticks = loop.ticks
+            start = time.perf_counter()
+            next_deadline = loop.tick()
+            if loop.ticks != ticks:
+                tick_durations.append(time.perf_counter() - start)
+                tick_bytes.append(display.last_frame.bytes)
+                tick_commands.append(display.last_frame.commands)
+                tick_writes.append(display.last_frame.writes)
+
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        _wait_until_idle(simulator)
+        during_run = simulator.commands[commands_before:]
+    finally:
+        simulator.stop()
+
+    add_result(results, 'display.bytes_per_tick_mean', statistics.mean(tick_bytes), 'bytes', LOWER)
+    add_result(results, 'display.bytes_per_tick_max', max(tick_bytes), 'bytes', LOWER)
+    add_result(results, 'display.commands_per_tick_mean', statistics.mean(tick_commands), 'commands', LOWER)
+    add_result(results, 'display.writes_per_tick_mean', statistics.mean(tick_writes), 'writes', LOWER)
+    add_result(results, 'display.tick_duration_median', statistics.median(tick_durations), 's', LOWER)
+    add_result(results, 'display.bytes_per_second', sum(tick_bytes) / seconds, 'bytes/s', LOWER)
+    for name in sorted({command.name for command in during_run}):
+        count = sum(command.name == name for command in during_run)
+        add_result(results, f'display.{name}_per_second', count / seconds, 'commands/s', LOWER)
+    add_result(results, 'display.unknown_bytes', simulator.unknown_bytes, 'bytes', LOWER)
+
+
+def run_benchmarks(groups: Sequence[str] = GROUPS, repeat=5, poll_seconds=1.0, display_seconds=3.0,
+                   num_frames=1000) -> dict:
+    """
+    :param groups: which of GROUPS to run
+    :param repeat: how many times to repeat each throughput and latency measurement
+    :param poll_seconds: how long to poll for in each repeat of the poll benchmark
+    :param display_seconds: how long to run the render loop for
+    :param num_frames: how many frames of the synthetic ride to use
+    :return: the results along with enough about the run to tell runs apart
+    """
+    live_data_dict = load_live_data_dict()
+    frames = synthetic_frames(live_data_dict, num_frames)
+    results: Results = {}
+
+    if 'decode' in groups:
+        bench_decode(results, live_data_dict, frames, repeat)
+    if 'poll' in groups:
+        bench_poll(results, live_data_dict, frames, repeat, poll_seconds)
+    if 'display' in groups:
+        bench_display(results, live_data_dict, frames, display_seconds)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'version': RESULTS_VERSION,
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'results': results,
+    }
+
+
+def find_regressions(results: Results, baseline: Results, threshold: float) -> List[str]:
+    """
+    :param threshold: the fraction by which a metric may get worse before it counts as a regression, e.g. 0.1 for 10%
+    :return: a description of each metric which got worse by more than threshold. Metrics in only one run are ignored.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        old, new = baseline[name]['value'], result['value']
+        if result['better'] == HIGHER:
+            worse = old > 0 and new < old * (1 - threshold)
+        else:
+            worse = new > old * (1 + threshold) if old > 0 else new > 0
+
+        if worse:
+            change = (new - old) / old if old else math.inf
+            regressions.append(f'{name}: {old:.6g} -> {new:.6g} {result["unit"]} ({change:+.1%})')
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmarks decoding, polling and the display and compares against a baseline')
+    parser.add_argument('--group', action='append', choices=GROUPS, dest='groups',
+                        help='a group of benchmarks to run. Can be given more than once. Defaults to all of them.')
+    parser.add_argument('--repeat', type=int, default=5, help='how many times to repeat each measurement')
+    parser.add_argument('--poll-seconds', type=float, default=1.0, help='how long to poll for in each repeat')
+    parser.add_argument('--display-seconds', type=float, default=3.0, help='how long to run the render loop for')
+    parser.add_argument('--output', metavar='PATH', help='write the results to this file instead of printing them')
+    parser.add_argument('--baseline', metavar='PATH', help='the results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the fraction by which a metric may get worse before it counts as a regression')
+    args = parser.parse_args()
+
+    run = run_benchmarks(args.groups or GROUPS, args.repeat, args.poll_seconds, args.display_seconds)
+
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(run, out_file, indent=2)
+    else:
+        print(json.dumps(run, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline_run = json.load(baseline_file)
+
+        found = find_regressions(run['results'], baseline_run['results'], args.threshold)
+        for regression in found:
+            print(f'Regression in {regression}', file=sys.stderr)
+        if found:
+            sys.exit(1)
+        print(f'No regressions against {baseline_run.get("commit") or args.baseline}', file=sys.stderr)
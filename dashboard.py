@@ -0,0 +1,153 @@
+import asyncio
+from argparse import ArgumentParser
+from datetime import datetime
+from typing import Mapping, Union
+
+from display import RooibosDisplay
+from display.render_loop import RenderLoop, CRITICAL, COSMETIC
+from display.tank_bar import TANK_GALLONS
+from drivers.derived_channels import DerivedChannels, LiveDataWithChannels, SavedTotals, default_channels
+from drivers.ecm import Ecm
+from drivers import tracing
+from drivers.async_ecm import AsyncEcm
+from drivers.broker import LiveDataSubscriber
+from drivers.live_data_schema import load_live_data_dict
+
+PARAMETERS = ['engine_rpm', 'vehicle_speed_mph', 'fuel_pulse_front', 'fuel_pulse_rear', 'DIn']
+DISPLAY_BAUD = 115200
+TICK_RATE = 30  # the fastest any element gets updated, in Hz
+SWITCHES = ('left_turn', 'right_turn', 'high_beam')
+TOTALS_PATH = 'refill.json'  # the fuel used and miles ridden since the tank was filled
+SAVE_PERIOD = 5  # seconds between saves of the totals
+
+
+def refill(display: RooibosDisplay, derived_channels: DerivedChannels, saved_totals: SavedTotals = None):
+    """Similar to resetting a trip meter, calling this indicates that the tank has been refilled."""
+    for name in ('fuel_used_gallons', 'trip_miles'):
+        derived_channels.reset(name, initial=0.0)
+    if saved_totals is not None:
+        saved_totals.save(dict.fromkeys(saved_totals.names, 0.0))
+    display.tank_bar.refill()
+
+
+def build_render_loop(display: RooibosDisplay, ecm: Union[Ecm, AsyncEcm, LiveDataSubscriber],
+                      switches: Mapping[str, bool] = None, derived_channels: DerivedChannels = None,
+                      saved_totals: SavedTotals = None) -> RenderLoop:
+    """
+    Sets up the rate at which each element of the dashboard gets updated
+
+    :param switches: the state of the handlebar switches the ECM doesn't know about, keyed by left_turn, right_turn
+        and high_beam. Read every time the lights are updated so it can be changed while the loop runs.
+        All of them are off by default.
+    :param derived_channels: the channels layered over the live data. Pass them in to keep hold of them,
+        e.g. for refill(display, derived_channels). Defaults to default_channels(TANK_GALLONS) starting from
+        the saved totals.
+    :param saved_totals: where the fuel used since the last refill is kept so that it survives a restart.
+        It is saved every SAVE_PERIOD seconds. Nothing is kept by default.
+    """
+    if switches is None:
+        switches = dict.fromkeys(SWITCHES, False)
+    if derived_channels is None:
+        derived_channels = DerivedChannels(
+            default_channels(TANK_GALLONS, **(saved_totals.load() if saved_totals is not None else {}))
+        )
+
+    def get_live_data():
+        live_data = ecm.live_data
+        if live_data is None:
+            return None  # nothing from the ECM yet. Only the updates which don't need it run.
+        with tracing.span('derived channels', seq=live_data.seq):
+            return LiveDataWithChannels(derived_channels.update(live_data), live_data)
+
+    # a serial byte takes 10 bits on the wire
+    loop = RenderLoop(display, get_live_data, byte_budget=DISPLAY_BAUD // 10 // TICK_RATE, tick_period=1 / TICK_RATE)
+
+    loop.schedule(
+        'tachometer', 1 / TICK_RATE, lambda live_data: display.rpm_bar.update(round(live_data['engine_rpm'])),
+        priority=CRITICAL
+    )
+    loop.schedule_element(display.speedometer, 1 / 10, 'vehicle_speed_mph', priority=CRITICAL)
+    loop.schedule_element(display.gear_indicator, 1 / 10, 'estimated_gear')
+    loop.schedule('neutral', 1 / 10, lambda live_data: display.neutral_light.update(live_data['DIn']['Neutral Input']))
+    # the switches are read often so they show up straight away. The blinks are timed against the update's deadline
+    # rather than when it happens to run, so they stay even.
+    blinkers = loop.schedule(
+        'blinkers', 1 / 10,
+        lambda live_data: display.turn_indicators.update(switches['right_turn'], switches['left_turn'],
+                                                         now=blinkers.deadline),
+        needs_live_data=False
+    )
+    loop.schedule('high beam', 1 / 10, lambda live_data: display.high_beam.update(switches['high_beam']),
+                  needs_live_data=False)
+    loop.schedule('ecm status', 1 / 10,
+                  lambda live_data: display.ecm_status.update(ecm.health, ecm.data_age),
+                  needs_live_data=False)
+    loop.schedule('clock', 1, lambda live_data: display.clock.update(datetime.now()), priority=COSMETIC,
+                  needs_live_data=False)
+    loop.schedule_element(display.tank_bar, 1, 'fuel_remaining_gallons', 'range_miles', priority=COSMETIC)
+    if saved_totals is not None:
+        loop.schedule('save totals', SAVE_PERIOD, lambda live_data: saved_totals.save(derived_channels.values),
+                      priority=COSMETIC)
+    loop.schedule('assets', 1 / 10, lambda live_data: display.load_next_assets(), priority=COSMETIC,
+                  needs_live_data=False)
+
+    return loop
+
+
+async def run_async(ecm: AsyncEcm, loop: RenderLoop):
+    """Polls the ECM and drives the display from the same event loop"""
+    await ecm.begin_poll()
+    try:
+        await loop.run_async(baud=DISPLAY_BAUD)
+    finally:
+        await ecm.end_poll()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Runs the dashboard')
+    parser.add_argument('--ecm-port', default='/dev/ttyUSB0')
+    parser.add_argument('--display-port', default='/dev/ttyUSB1')
+    parser.add_argument('--mock', action='store_true', help='use old ECM data instead of talking to the ECM')
+    parser.add_argument('--subscribe', action='store_true',
+                        help='read the live data from a running broker (python -m drivers.broker) instead of the ECM')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='poll the ECM on an event loop in this process instead of in a separate process')
+    parser.add_argument('--refill', action='store_true', help='the tank has just been filled up')
+    parser.add_argument('--trace', metavar='PATH', help='write a Chrome trace of every stage from ECM to display')
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.start_tracing(args.trace, process_name='dashboard')
+
+    live_data_dict = load_live_data_dict()
+
+    if args.subscribe:
+        ecm = LiveDataSubscriber(live_data_dict, PARAMETERS)
+    elif args.asyncio:
+        ecm = AsyncEcm(args.ecm_port, live_data_dict, mock=args.mock, parameters=PARAMETERS)
+    else:
+        ecm = Ecm(args.ecm_port, live_data_dict, mock=args.mock, parameters=PARAMETERS)
+        ecm.begin_poll()
+
+    display = RooibosDisplay(args.display_port, defer_assets=True)
+    saved_totals = SavedTotals(TOTALS_PATH)
+    derived_channels = DerivedChannels(default_channels(TANK_GALLONS, **saved_totals.load()))
+    if args.refill:
+        refill(display, derived_channels, saved_totals)
+
+    loop = build_render_loop(display, ecm, derived_channels=derived_channels, saved_totals=saved_totals)
+    try:
+        if args.asyncio:
+            asyncio.run(run_async(ecm, loop))
+        else:
+            loop.run()
+    except KeyboardInterrupt:
+        for scheduled in loop.updates:
+            print(scheduled)
+    finally:
+        if args.subscribe:
+            ecm.close()
+        elif not args.asyncio:
+            ecm.end_poll()
+        saved_totals.save(derived_channels.values)
+        tracing.stop_tracing()
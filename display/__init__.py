@@ -1,32 +1,74 @@
 import time
 
-from gtt import GttDisplay
 from gtt.byte_formatting import ints_to_signed_shorts, hex_colors_to_bytes
 from gtt.enums import BarDirection
 
-from display import rpm_bar, clock, tank_bar, speedometer, gear_indicator, lights
+from display import rpm_bar, clock, tank_bar, speedometer, gear_indicator, lights, ecm_status
+from display.batching import BatchingConnection, FrameStats
+from display.retained_state import RetainedStateDisplay
 
 
-class RooibosDisplay(GttDisplay):
-    def __init__(self, port: str):
-        super().__init__(port)
+class RooibosDisplay(RetainedStateDisplay):
+    def __init__(self, port: str, quantize_bars=True, defer_assets=False):
+        """
+        :param port: passed through to the GttDisplay constructor
+        :param quantize_bars: If set to true, bar updates which would move the bar by less than a pixel are skipped
+        :param defer_assets: If set to true, bitmaps aren't loaded until load_next_assets() is called
+            so that the tachometer and speedometer come up sooner
+        """
+        super().__init__(port, quantize_bars)
+        self._conn = BatchingConnection(self._conn)
         self.clear_screen()
         self.load_font('sans', 'rooibos_assets/Oswald-VariableFont_wght.ttf')
 
+        # the most important elements go first so they are working as soon as possible
         self.rpm_bar = rpm_bar.RpmBar(self)
-        self.clock = clock.Clock(self)
-        self.tank_bar = tank_bar.TankBar(self)
         self.speedometer = speedometer.Speedometer(self)
         self.gear_indicator = gear_indicator.GearIndicator(self)
+        self.neutral_light = lights.NeutralLight(self)
         self.turn_indicators = lights.TurnIndicator(self)
         self.high_beam = lights.HighBeam(self)
-        self.neutral_light = lights.NeutralLight(self)
+        self.clock = clock.Clock(self)
+        self.tank_bar = tank_bar.TankBar(self)
+        self.ecm_status = ecm_status.EcmStatus(self)
+
+        self.elements_without_assets = [self.turn_indicators, self.high_beam]
+        if not defer_assets:
+            while self.load_next_assets():
+                pass
+
+    def load_next_assets(self) -> bool:
+        """
+        Loads the assets of one element which is still missing them
+
+        :return: False if there was nothing left to load
+        """
+        if not self.elements_without_assets:
+            return False
+
+        self.elements_without_assets.pop(0).load_assets()
+        return True
+
+    def frame(self, seq: int = None):
+        """
+        Use as `with display.frame():` around one tick worth of element updates.
+        seq is the sequence number of the live data frame being shown, which is recorded in the trace of the write.
+        All the commands issued inside are sent to the display in one write.
+        Afterwards display.last_frame tells you how many commands, bytes and writes were sent.
+        """
+        return self._conn.frame(seq)
+
+    @property
+    def last_frame(self) -> FrameStats:
+        return self._conn.last_frame
 
     def overwrite_bar(self, bar_id: int, max_value: int,
                          x_pos: int, y_pos: int, width: int, height: int,
                          min_value: int = 0, fg_color_hex='FFFFFF', bg_color_hex='000000',
                          direction: BarDirection = BarDirection.BOTTOM_TO_TOP):
         """Acts like create_plain_bar but all the ID reuse protection is turned off"""
+        self.bar_defined(bar_id, min_value, max_value, length_px=max(width, height))  # bars grow along their long side
+
         self._conn.write(
             bytes.fromhex('FE 67') +
             bar_id.to_bytes(1, 'big') +
@@ -50,13 +92,13 @@ if __name__ == '__main__':
         d.rpm_bar.update(rpm)
         time.sleep(0.05)
 
-    for odo in range(0, 200, 3):
-        d.tank_bar.update(odo)
+    for tenths in range(tank_bar.TANK_GALLONS * 10, 0, -1):
+        d.tank_bar.update(tenths / 10, range_miles=tenths * 4.5)
         time.sleep(0.05)
 
-    for kwargs in [dict(left_turn=True)] * 30 + [dict()] * 20 + [dict(right_turn=True)] * 30 + [{}]:
+    for kwargs in [dict(left_turn=True)] * 6 + [dict()] * 2 + [dict(right_turn=True)] * 6 + [{}]:
         d.turn_indicators.update(**kwargs)
-        time.sleep(0.05)
+        time.sleep(d.turn_indicators.blink_duration)
 
     d.neutral_light.update(True)
     d.high_beam.update(True)
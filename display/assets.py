@@ -0,0 +1,82 @@
+"""
+Keeps the display's copy of the assets folder up to date without rewriting files which haven't changed.
+
+Put the display into mass storage mode (GttDisplay.enter_mass_storage_mode) and run
+    python -m display.assets /path/to/mounted/display
+A manifest of content hashes is kept next to the assets on the display so only changed files are copied.
+"""
+import hashlib
+import json
+import shutil
+from argparse import ArgumentParser
+from os import path, listdir
+from typing import Dict, List
+
+LOCAL_ASSETS_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'assets')
+DISPLAY_ASSETS_DIR = 'rooibos_assets'
+MANIFEST_NAME = 'manifest.json'
+
+
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as asset_file:
+        for chunk in iter(lambda: asset_file.read(1 << 16), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def local_manifest(assets_dir: str = LOCAL_ASSETS_DIR) -> Dict[str, str]:
+    """:return: the name and content hash of every asset in the given folder"""
+    return {
+        name: hash_file(path.join(assets_dir, name))
+        for name in sorted(listdir(assets_dir))
+        if path.isfile(path.join(assets_dir, name)) and name != MANIFEST_NAME
+    }
+
+
+def read_manifest(storage_dir: str) -> Dict[str, str]:
+    """:return: the hashes of the assets on the display's storage as of the last sync, or {} if it was never synced"""
+    try:
+        with open(path.join(storage_dir, DISPLAY_ASSETS_DIR, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def sync_assets(storage_dir: str, assets_dir: str = LOCAL_ASSETS_DIR) -> List[str]:
+    """
+    Copies the assets which are missing or different on the display's storage
+
+    :param storage_dir: where the display's storage is mounted
+    :param assets_dir: the local assets folder
+    :return: the names of the assets which were copied
+    """
+    wanted = local_manifest(assets_dir)
+    on_display = read_manifest(storage_dir)
+    target_dir = path.join(storage_dir, DISPLAY_ASSETS_DIR)
+    if not path.isdir(target_dir):
+        raise FileNotFoundError(f'{target_dir} does not exist. Is the display mounted?')
+
+    copied = []
+    for name, content_hash in wanted.items():
+        if on_display.get(name) == content_hash and path.exists(path.join(target_dir, name)):
+            continue
+
+        shutil.copyfile(path.join(assets_dir, name), path.join(target_dir, name))
+        copied.append(name)
+
+    if wanted != on_display:
+        with open(path.join(target_dir, MANIFEST_NAME), 'w') as manifest_file:
+            json.dump(wanted, manifest_file, indent=4)
+
+    return copied
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Copies changed assets onto the display while it is in mass storage mode')
+    parser.add_argument('storage_dir', help='where the display is mounted')
+    args = parser.parse_args()
+
+    copied_names = sync_assets(args.storage_dir)
+    print(f'Copied {len(copied_names)} assets: {", ".join(copied_names)}' if copied_names else 'Assets are up to date')
@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from drivers import tracing
+
+
+class FrameStats(NamedTuple):
+    commands: int
+    bytes: int
+    writes: int  # more than one if something read from the display in the middle of the frame
+
+
+class BatchingConnection:
+    """
+    Wraps the display's serial connection so that everything written during a frame goes out in a single write.
+    Outside of a frame writes go straight through. Anything else is passed on to the wrapped connection.
+
+    Reading from the display in a frame, e.g. to wait for a status reply, has to send what has been collected first,
+    so such a frame goes out in several writes. The stats of the frame still cover all of them.
+    """
+
+    def __init__(self, conn):
+        """:param conn: the serial.Serial connection to the display"""
+        self.conn = conn
+        self.last_frame = FrameStats(0, 0, 0)
+        self.frames_sent = 0
+
+        self._buffer = bytearray()
+        self._commands = 0
+        self._flushed_bytes = 0  # bytes of the current frame which have already been sent by flush()
+        self._writes = 0
+        self._depth = 0
+        self._seq = None  # the live data frame the current frame shows
+
+    @property
+    def frame_bytes(self) -> int:
+        """:return: how many bytes the current frame has sent or collected so far"""
+        return self._flushed_bytes + len(self._buffer)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def write(self, data: bytes) -> int:
+        if not self._depth:
+            return self.conn.write(data)
+
+        self._buffer += data
+        self._commands += 1
+        return len(data)
+
+    def flush(self):
+        """Sends whatever has been collected so far, e.g. before waiting for a reply from the display"""
+        if self._buffer:
+            self.conn.write(self._buffer)
+            if self._depth:
+                self._flushed_bytes += len(self._buffer)
+                self._writes += 1
+            self._buffer.clear()
+
+        self.conn.flush()
+
+    def read(self, *args, **kwargs):
+        self.flush()
+        return self.conn.read(*args, **kwargs)
+
+    @contextmanager
+    def frame(self, seq: int = None):
+        """
+        Collects all writes until the outermost frame ends and then sends them together
+
+        :param seq: the sequence number of the live data frame being shown. Only used for tracing.
+        """
+        if not self._depth:
+            self._seq = seq
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if not self._depth:
+                writes = self._writes + bool(self._buffer)
+                self.last_frame = FrameStats(self._commands, self.frame_bytes, writes)
+                self.frames_sent += 1
+                self._commands = 0
+                self._flushed_bytes = 0
+                self._writes = 0
+                if self._buffer:
+                    with tracing.span('display write', seq=self._seq, commands=self.last_frame.commands,
+                                      bytes=len(self._buffer)):
+                        self.conn.write(self._buffer)
+                    self._buffer.clear()
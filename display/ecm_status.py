@@ -0,0 +1,36 @@
+import math
+
+from gtt import GttDisplay
+
+from display.element import Element
+
+STALE_AFTER = 0.5  # seconds without a new frame before the gauges are treated as out of date
+
+
+class EcmStatus(Element):
+    """A warning under the speedometer which shows up when the live data from the ECM is missing or out of date"""
+
+    def __init__(self, display: GttDisplay):
+        super().__init__(display)
+
+        self.display.create_label(
+            'ecm_status',
+            x_pos=150, y_pos=180, width=180, height=30,
+            font_size=12, font_id='sans', fg_color_hex='FF0000',
+            value=''
+        )
+
+    def update(self, health: str, data_age: float):
+        """:param health: what the poller is doing, e.g. Ecm.health
+        :param data_age: seconds since the newest frame was received, e.g. Ecm.data_age
+        """
+        if data_age <= STALE_AFTER:
+            text = ''
+        elif health != 'ok':
+            text = f'ECM {health}'
+        elif math.isinf(data_age):
+            text = 'No ECM data'
+        else:
+            text = f'ECM data {data_age:.0f} s old'
+
+        self.display.update_label('ecm_status', text)
@@ -8,6 +8,15 @@ class Element(ABC):
 
     def __init__(self, display: GttDisplay):
         self.display: GttDisplay = display
+        self.assets_loaded = True
+
+    def load_assets(self):
+        """
+        Loads any bitmaps the element needs from the display's storage.
+        Elements with assets set assets_loaded to False until this is called so that the display can load them
+        after the more important elements are up and running.
+        """
+        self.assets_loaded = True
 
     @abstractmethod
     def update(self, value):
@@ -4,7 +4,7 @@ from display.element import Element
 
 
 class GearIndicator(Element):
-    """A digital speedometer"""
+    """Displays which gear the bike is in"""
 
     def __init__(self, display: GttDisplay):
         super().__init__(display)
@@ -21,8 +21,7 @@ class GearIndicator(Element):
             font_size=40, font_id='sans'
         )
 
-    def update(self, speed: float, rpm: float):
-        gear = 5  # TODO actually calculate
-
-        self.display.update_label('gear', str(gear))
+    def update(self, gear: int):
+        """:param gear: usually the estimated_gear derived channel. 0 means the bike is stopped or coasting."""
+        self.display.update_label('gear', str(gear) if gear else '-')
 
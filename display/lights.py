@@ -4,6 +4,9 @@ from gtt import GttDisplay
 
 from display.element import Element
 
+# how early a blink may be, so that a caller whose update times add up to blink_duration doesn't miss it by rounding
+BLINK_SLACK = 0.001
+
 
 class TurnIndicator(Element):
     """A left or right blinking arrow"""
@@ -16,27 +19,36 @@ class TurnIndicator(Element):
         self.width = 65
         self.height = 41
         self.blink_duration = 0.5  # length in seconds of half of a blink cycle
-        self.blink_schedule = None  # a time in the future when we should display or hide the arrow
+        self.next_blink = None  # when the arrow should next be shown or hidden, on the clock passed to update()
         self.blink_blanked = False  # if the arrow is blinking, is it in the blank part of the blink or the visible part
         self.last_state = None
+        self.assets_loaded = False
 
-        display.load_bitmap('left_turn', 'rooibos_assets/left_turn.bmp')
-        display.load_bitmap('right_turn', 'rooibos_assets/right_turn.bmp')
-        display.set_bitmap_transparency('left_turn', 'FFFFFF')
-        display.set_bitmap_transparency('right_turn', 'FFFFFF')
+    def load_assets(self):
+        self.display.load_bitmap('left_turn', 'rooibos_assets/left_turn.bmp')
+        self.display.load_bitmap('right_turn', 'rooibos_assets/right_turn.bmp')
+        self.display.set_bitmap_transparency('left_turn', 'FFFFFF')
+        self.display.set_bitmap_transparency('right_turn', 'FFFFFF')
+        super().load_assets()
 
     def hide_bitmap(self):
         self.display.set_drawing_color('000000')
         self.display.draw_rectangle(self.x_pos, self.y_pos, self.width, self.height, fill=True)
 
     def show_bitmap(self, left_right: str):
-        self.display.display_bitmap(f'{left_right}_turn', self.x_pos, self.y_pos)
+        if self.assets_loaded:
+            self.display.display_bitmap(f'{left_right}_turn', self.x_pos, self.y_pos)
 
-    def update(self, right_turn=False, left_turn=False):
+    def update(self, right_turn=False, left_turn=False, now: float = None):
         """Can be used to display the left or right turn signals which will blink.
-        Even if you're not changing the state of the arrows, you should call this method
-        because otherwise the blinking will not work.
+        Call this often, e.g. 10 times a second, so that the switches showing up and the blinks are both punctual.
+
+        :param now: the current time in seconds, e.g. the deadline of the update in a RenderLoop.
+            Defaults to time.monotonic().
         """
+        if now is None:
+            now = time.monotonic()
+
         if right_turn:
             new_state = 'right'
         elif left_turn:
@@ -44,26 +56,27 @@ class TurnIndicator(Element):
         else:
             new_state = None
 
-        time_to_blink = self.blink_schedule is not None and self.blink_schedule < time.time()
+        if new_state is None:
+            self.hide_bitmap()
+            self.blink_blanked = False
+            self.next_blink = None
+
+        elif new_state != self.last_state:
+            self.show_bitmap(new_state)
+            self.blink_blanked = False
+            self.next_blink = now + self.blink_duration
 
-        if new_state == self.last_state and new_state is not None and time_to_blink:
+        elif now >= self.next_blink - BLINK_SLACK:
             if self.blink_blanked:
                 self.show_bitmap(new_state)
             else:
                 self.hide_bitmap()
 
             self.blink_blanked = not self.blink_blanked
-            self.blink_schedule = time.time() + self.blink_duration
-
-        elif new_state is None:
-            self.hide_bitmap()
-            self.blink_schedule = None
-            self.blink_blanked = False
-
-        elif new_state != self.last_state:
-            self.show_bitmap(new_state)
-            self.blink_blanked = False
-            self.blink_schedule = time.time() + self.blink_duration
+            # stays in step with when the blinking started unless the caller fell a whole half cycle behind
+            self.next_blink += self.blink_duration
+            if self.next_blink <= now:
+                self.next_blink = now + self.blink_duration
 
         self.last_state = new_state
 
@@ -74,16 +87,19 @@ class HighBeam(Element):
     def __init__(self, display: GttDisplay):
         super().__init__(display)
 
-        display.load_bitmap('high_beam', 'rooibos_assets/high_beam.bmp')
-        display.set_bitmap_transparency('high_beam', 'FFFFFF')
-
         self.x_pos = 400
         self.y_pos = 80
         self.width = 70
         self.height = 45
+        self.assets_loaded = False
+
+    def load_assets(self):
+        self.display.load_bitmap('high_beam', 'rooibos_assets/high_beam.bmp')
+        self.display.set_bitmap_transparency('high_beam', 'FFFFFF')
+        super().load_assets()
 
     def update(self, show: bool):
-        if show:
+        if show and self.assets_loaded:
             self.display.display_bitmap(f'high_beam', self.x_pos, self.y_pos)
         else:
             self.display.set_drawing_color('000000')
@@ -0,0 +1,215 @@
+import asyncio
+import time
+from collections.abc import Mapping
+from typing import Callable, List, Optional
+
+from display.element import Element
+from drivers import tracing
+
+CRITICAL = 0  # updates with this priority are sent even if they blow the byte budget
+NORMAL = 1
+COSMETIC = 2
+
+
+class ScheduledUpdate:
+    """An element update which runs at its own rate along with how punctual it has been"""
+
+    def __init__(self, name: str, period: float, update: Callable[[Optional[Mapping]], None], priority=NORMAL,
+                 needs_live_data=True):
+        """
+        :param name: used to identify the update in metrics
+        :param period: seconds between updates
+        :param update: called with the latest live data whenever the update is due
+        :param priority: lower numbers go out first when there isn't enough link bandwidth for everything
+        :param needs_live_data: If set to true, the update is skipped while there is no live data.
+            Otherwise it runs anyway and is called with None.
+        """
+        self.name = name
+        self.period = period
+        self.update = update
+        self.priority = priority
+        self.needs_live_data = needs_live_data
+        self.deadline = None
+        self.estimated_bytes = 0.0  # a moving average of how many bytes the update sends to the display
+
+        self.runs = 0
+        self.missed = 0  # deadlines which were skipped because the loop was more than a whole period behind
+        self.deferred = 0  # times the update was held back a tick to stay within the byte budget
+        self.no_data = 0  # deadlines which were skipped because there was no live data yet
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    @property
+    def mean_lateness(self) -> float:
+        return self.total_lateness / self.runs if self.runs else 0.0
+
+    def __repr__(self):
+        return f'{self.name}: {self.runs} runs, {self.missed} missed, {self.deferred} deferred, ' \
+               f'{self.no_data} without data, {self.mean_lateness * 1000:.1f} ms mean late, {self.max_lateness * 1000:.1f} ms max late'
+
+
+class RenderLoop:
+    """
+    Drives the dashboard elements from the ECM, each at its own rate.
+    Updates are scheduled against absolute time.monotonic() deadlines so slow ticks don't make the loop drift,
+    and all the updates which are due at the same time share one live data snapshot and one display frame.
+
+    If a byte budget is set, due updates go out in priority order until the estimated cost of the next one
+    would exceed what's left of the budget. The rest stay due and run on a later tick with whatever the live data
+    is by then, so a backlog never builds up. CRITICAL updates are never held back.
+    With a tick period as well, each tick gets a slot of that length to itself and the next one doesn't start
+    until the slot is over, so no more than the budget goes out in any tick period.
+    """
+
+    def __init__(self, display, get_live_data: Callable[[], Optional[Mapping]], byte_budget: int = None,
+                 tick_period: float = None):
+        """
+        :param display: the RooibosDisplay to draw on
+        :param get_live_data: returns the latest live data, usually lambda: ecm.live_data,
+            or None if there isn't any yet
+        :param byte_budget: the most bytes to send to the display in one tick. Unlimited by default.
+        :param tick_period: the least time from the start of one tick to the start of the next, usually the time
+            the link takes to send byte_budget bytes. By default a tick runs as soon as anything is due.
+        """
+        self.display = display
+        self.get_live_data = get_live_data
+        self.byte_budget = byte_budget
+        self.tick_period = tick_period
+        self.updates: List[ScheduledUpdate] = []
+        self._next_tick = None  # the time.monotonic() time at which the current tick's slot ends
+
+        self.ticks = 0
+        self.max_tick_duration = 0.0
+
+    def schedule(self, name: str, period: float, update: Callable[[Optional[Mapping]], None],
+                 priority=NORMAL, needs_live_data=True) -> ScheduledUpdate:
+        """
+        Adds an update to the loop. Due updates run in priority order, then the one which has been due
+        for longest first, and then in the order they were scheduled in.
+
+        :param name: used to identify the update in metrics
+        :param period: seconds between updates
+        :param update: called with the latest live data whenever the update is due
+        :param priority: CRITICAL, NORMAL, COSMETIC or any other int. Lower goes first.
+        :param needs_live_data: If set to false, the update also runs while get_live_data() returns None,
+            e.g. for a clock or a warning that the ECM isn't answering
+        """
+        scheduled = ScheduledUpdate(name, period, update, priority, needs_live_data)
+        self.updates.append(scheduled)
+        self.updates.sort(key=lambda item: item.priority)
+        return scheduled
+
+    def schedule_element(self, element: Element, period: float, *parameters: str, priority=NORMAL) -> ScheduledUpdate:
+        """Schedules element.update to be called with the values of the given live data parameters"""
+        return self.schedule(
+            type(element).__name__, period,
+            lambda live_data: element.update(*(live_data[name] for name in parameters)),
+            priority
+        )
+
+    def tick(self) -> float:
+        """
+        Runs every update which is due, unless the slot of the previous tick hasn't ended yet
+
+        :return: the time.monotonic() time at which the next tick should run
+        """
+        start = time.monotonic()
+        if self._next_tick is not None and start < self._next_tick:
+            return self._next_tick
+
+        due = []
+        for scheduled in self.updates:
+            if scheduled.deadline is None:
+                scheduled.deadline = start
+            if scheduled.deadline <= start:
+                due.append(scheduled)
+        # an update held back by the budget goes ahead of the ones of the same priority which became due after it
+        due.sort(key=lambda item: (item.priority, item.deadline))
+
+        if due:
+            with tracing.span('live data'):
+                live_data = self.get_live_data()
+            # lets a trace follow a frame from the ECM to the display write which showed it
+            seq = getattr(live_data, 'seq', None)
+            frame_timestamp = getattr(live_data, 'timestamp', None)
+            with self.display.frame(seq) as frame:
+                for scheduled in due:
+                    if live_data is None and scheduled.needs_live_data:
+                        scheduled.no_data += 1
+                        scheduled.deadline += scheduled.period
+                        if scheduled.deadline <= start:
+                            scheduled.deadline += (int((start - scheduled.deadline) // scheduled.period) + 1) * \
+                                                  scheduled.period
+                        continue
+
+                    sent = frame.frame_bytes
+                    if self.byte_budget is not None and scheduled.priority != CRITICAL \
+                            and sent + scheduled.estimated_bytes > self.byte_budget:
+                        scheduled.deferred += 1
+                        continue
+
+                    lateness = time.monotonic() - scheduled.deadline
+                    with tracing.span(scheduled.name, seq=seq, frame_timestamp=frame_timestamp):
+                        scheduled.update(live_data)
+                    if scheduled.runs:
+                        scheduled.estimated_bytes += (frame.frame_bytes - sent - scheduled.estimated_bytes) / 4
+                    else:
+                        scheduled.estimated_bytes = frame.frame_bytes - sent
+
+                    scheduled.runs += 1
+                    scheduled.total_lateness += lateness
+                    scheduled.max_lateness = max(scheduled.max_lateness, lateness)
+
+                    scheduled.deadline += scheduled.period
+                    if scheduled.deadline <= start:
+                        behind = int((start - scheduled.deadline) // scheduled.period) + 1
+                        scheduled.missed += behind
+                        scheduled.deadline += behind * scheduled.period
+
+            self.ticks += 1
+            self.max_tick_duration = max(self.max_tick_duration, time.monotonic() - start)
+            if self.tick_period is not None:
+                # deferred updates are still due, so without this they would go out straight away in another write
+                self._next_tick = start + self.tick_period
+
+        next_deadline = min((scheduled.deadline for scheduled in self.updates), default=start + 1)
+        if self._next_tick is not None:
+            next_deadline = max(next_deadline, self._next_tick)
+        return next_deadline
+
+    def run(self, duration: float = None):
+        """
+        Runs updates as they come due
+
+        :param duration: how many seconds to run for. Runs forever by default.
+        """
+        end = None if duration is None else time.monotonic() + duration
+        while end is None or time.monotonic() < end:
+            next_deadline = self.tick()
+            if end is not None:
+                next_deadline = min(next_deadline, end)
+
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    async def run_async(self, duration: float = None, baud: int = None):
+        """
+        Like run() but sleeps on the event loop so that it can share it with an AsyncEcm
+
+        :param duration: how many seconds to run for. Runs forever by default.
+        :param baud: the speed of the link to the display. If given, each tick waits until the link has had time to
+            send the previous frame. Writes then never back up in the serial driver and block the event loop,
+            and the updates which run get the newest live data instead of data from before the link was free.
+        """
+        end = None if duration is None else time.monotonic() + duration
+        while end is None or time.monotonic() < end:
+            ticks = self.ticks
+            next_deadline = self.tick()
+            if baud and self.ticks != ticks:
+                # a serial byte takes 10 bits on the wire
+                next_deadline = max(next_deadline, time.monotonic() + self.display.last_frame.bytes * 10 / baud)
+            if end is not None:
+                next_deadline = min(next_deadline, end)
+
+            await asyncio.sleep(max(0.0, next_deadline - time.monotonic()))
@@ -0,0 +1,107 @@
+from gtt import GttDisplay
+
+
+class RetainedStateDisplay(GttDisplay):
+    """
+    A GttDisplay which remembers what it last sent for every label, bar and drawn region
+    and doesn't send commands that wouldn't change anything on the screen.
+    The serial line to the display is slow so every command that can be skipped makes the gauges more responsive.
+    """
+
+    def __init__(self, port: str, quantize_bars=True):
+        """
+        :param port: passed through to the GttDisplay constructor
+        :param quantize_bars: If set to true, bar updates which would move the bar by less than a pixel are skipped
+        """
+        self.quantize_bars = quantize_bars
+        self.commands_skipped = 0
+
+        self._label_values = {}
+        self._bar_values = {}
+        self._bar_scales = {}  # bar ID -> (min value, value per pixel)
+        self._regions = {}  # (x, y) -> what was last drawn there
+        self._drawing_color = None
+
+        super().__init__(port)
+
+    def forget_state(self):
+        """Call this if the display may have been changed behind our back, e.g. after it was reset"""
+        self._label_values.clear()
+        self._bar_values.clear()
+        self._regions.clear()
+        self._drawing_color = None
+
+    def clear_screen(self):
+        self.forget_state()
+        super().clear_screen()
+
+    def create_label(self, label_id, *args, **kwargs):
+        super().create_label(label_id, *args, **kwargs)
+        if 'value' in kwargs:
+            self._label_values[label_id] = kwargs['value']
+        else:
+            self._label_values.pop(label_id, None)
+
+    def update_label(self, label_id, value: str):
+        if self._label_values.get(label_id) == value:
+            self.commands_skipped += 1
+            return
+
+        super().update_label(label_id, value)
+        self._label_values[label_id] = value
+
+    def bar_defined(self, bar_id: int, min_value: int, max_value: int, length_px: int):
+        """
+        Must be called whenever a bar is created or redrawn since that resets the value it displays
+
+        :param length_px: the length of the bar in pixels in the direction that it grows
+        """
+        self._bar_values.pop(bar_id, None)
+        self._bar_scales[bar_id] = (min_value, (max_value - min_value) / max(1, length_px))
+
+    def forget_bar_value(self, bar_id: int):
+        """Makes sure the next value sent to the bar goes through, e.g. because something was drawn over it"""
+        self._bar_values.pop(bar_id, None)
+
+    def _bar_position(self, bar_id: int, value):
+        """:return: what value will look like on the bar. If bars are quantized this is the pixel it will end at."""
+        if not self.quantize_bars or bar_id not in self._bar_scales:
+            return value
+
+        min_value, value_per_px = self._bar_scales[bar_id]
+        return round((value - min_value) / value_per_px)
+
+    def update_bar_value(self, bar_id: int, value: int):
+        position = self._bar_position(bar_id, value)
+        if self._bar_values.get(bar_id) == position:
+            self.commands_skipped += 1
+            return
+
+        super().update_bar_value(bar_id, value)
+        self._bar_values[bar_id] = position
+
+    def set_drawing_color(self, color_hex: str):
+        if self._drawing_color == color_hex:
+            self.commands_skipped += 1
+            return
+
+        super().set_drawing_color(color_hex)
+        self._drawing_color = color_hex
+
+    def draw_rectangle(self, x_pos: int, y_pos: int, width: int, height: int, fill=False):
+        region = ('rectangle', width, height, self._drawing_color, fill)
+        if self._drawing_color is not None and self._regions.get((x_pos, y_pos)) == region:
+            self.commands_skipped += 1
+            return
+
+        super().draw_rectangle(x_pos, y_pos, width, height, fill=fill)
+        self._regions[(x_pos, y_pos)] = region
+
+    def display_bitmap(self, bitmap_id: str, x_pos: int, y_pos: int):
+        region = ('bitmap', bitmap_id)
+        if self._regions.get((x_pos, y_pos)) == region:
+            self.commands_skipped += 1
+            return
+
+        super().display_bitmap(bitmap_id, x_pos, y_pos)
+        self._regions[(x_pos, y_pos)] = region
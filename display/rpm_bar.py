@@ -1,3 +1,5 @@
+from bisect import bisect_left
+
 from gtt.byte_formatting import ints_to_signed_shorts, hex_colors_to_bytes
 from gtt.enums import BarDirection
 from gtt import GttDisplay
@@ -6,19 +8,36 @@ from display.element import Element
 
 MAX_RPM = 7600
 
+# The bar takes on the color of the highest breakpoint the RPM is above
+BREAKPOINTS = [800, 1700, 6000, 7100]
+ZONE_COLORS = ['FF0000', '0000FF', '00FF00', 'FFFF00', 'FF0000']  # one more than there are breakpoints
+
 
 class RpmBar(Element):
-    """A bar across the top of the screen that serves as a tachometer"""
+    """A bar across the top of the screen that serves as a tachometer.
+
+    There is one bar for every color the tachometer can be. They are all created on top of each other up front,
+    so changing color only takes updating the value of the bar in the new color, which draws it over the old one.
+    """
 
-    def __init__(self, display: GttDisplay):
+    def __init__(self, display: GttDisplay, hysteresis=100):
+        """
+        :param hysteresis: how many RPM below a breakpoint the RPM has to drop before the bar goes back to the
+            color below the breakpoint. Keeps the bar from flickering when the RPM hovers around a breakpoint.
+        """
         super().__init__(display)
 
         self.total_height = 40
         self.bar_height = self.total_height // 2
-        self.color = 'FFFFFF'
-        self.id = display._pick_new_id()
+        self.hysteresis = hysteresis
+        self.zone = 0
 
-        self._redraw_bar()
+        self.ids = {}  # color -> bar ID
+        for color in ZONE_COLORS:
+            if color not in self.ids:
+                self.ids[color] = display._pick_new_id()
+                self._draw_bar(color)
+        self.id = self.ids[ZONE_COLORS[self.zone]]
 
         label_width = 15
         for label_int in range(1, 8):
@@ -30,31 +49,32 @@ class RpmBar(Element):
                 value=str(label_int)
             )
 
-    def _redraw_bar(self):
-        """Redraws the bar over top of the old bar in order to change the color"""
+    def _draw_bar(self, color: str):
+        """Creates the bar of the given color"""
         self.display.overwrite_bar(
-            self.id, MAX_RPM,
+            self.ids[color], MAX_RPM,
             x_pos=0, y_pos=0, width=self.display.width, height=self.bar_height,
-            fg_color_hex=self.color,
+            fg_color_hex=color,
             direction=BarDirection.LEFT_TO_RIGHT
         )
 
+    def _find_zone(self, rpm: int) -> int:
+        """:return: the index into ZONE_COLORS for the given RPM taking hysteresis into account"""
+        zone = bisect_left(BREAKPOINTS, rpm)
+        if zone < self.zone:
+            # only go down once the RPM is clearly below the breakpoint
+            zone = min(self.zone, bisect_left(BREAKPOINTS, rpm + self.hysteresis))
+
+        return zone
+
     def update(self, rpm: int):
         """Displays the given RPM on the RPM bar with an appropriate color"""
-        new_color = 'FF0000'
-        color_breakpoints = {
-            800: '0000FF',
-            1700: '00FF00',
-            6000: 'FFFF00',
-            7100: 'FF0000',
-        }
-
-        for breakp, color in color_breakpoints.items():
-            if rpm > breakp:
-                new_color = color
-
-        if new_color != self.color:
-            self.color = new_color
-            self._redraw_bar()
+        zone = self._find_zone(rpm)
+        if zone != self.zone:
+            self.zone = zone
+            new_id = self.ids[ZONE_COLORS[zone]]
+            if new_id != self.id:
+                self.id = new_id
+                self.display.forget_bar_value(new_id)  # it's been covered up so it has to be redrawn
 
         self.display.update_bar_value(self.id, rpm)
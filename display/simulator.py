@@ -0,0 +1,259 @@
+"""
+A headless stand-in for the GTT display.
+It decodes the command stream the dashboard sends into a scene of labels, bars and drawn regions
+and models how long each command takes to reach the screen over a serial link of a given baud rate.
+
+Only the commands the dashboard uses are understood. Their layouts follow the GTT protocol manual and live in COMMANDS.
+Anything else is recorded as unknown and skipped up to the next command prefix.
+Commands which the display acknowledges, listed in STATUS_REPLIES, get a success status reply so that drivers
+waiting on one carry on.
+"""
+import os
+import select
+import time
+import tty
+from struct import Struct
+from threading import Event, Thread
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+COMMAND_PREFIX = 0xFE
+RESPONSE_PREFIX = 0xFC
+STATUS_SUCCESS = 0xFE
+
+# command byte -> (name, layout of the fixed size arguments, whether a NUL terminated string follows)
+COMMANDS: Dict[int, Tuple[str, Struct, bool]] = {
+    0x10: ('create_label', Struct('>BhhhhhBBB3s'), False),
+    0x11: ('update_label', Struct('>BB'), True),
+    0x28: ('load_font', Struct('>B'), True),
+    0x58: ('clear_screen', Struct(''), False),
+    0x5F: ('load_bitmap', Struct('>B'), True),
+    0x61: ('display_bitmap', Struct('>Bhh'), False),
+    0x62: ('set_bitmap_transparency', Struct('>B3s'), False),
+    0x63: ('set_drawing_color', Struct('>3s'), False),
+    0x67: ('create_plain_bar', Struct('>Bhhhhhh3s3sB'), False),
+    0x69: ('update_bar_value', Struct('>Bh'), False),
+    0x78: ('draw_rectangle', Struct('>hhhh'), False),
+    0x79: ('draw_filled_rectangle', Struct('>hhhh'), False),
+}
+# commands the display answers with RESPONSE_PREFIX, the command byte, a length short and that many status bytes
+STATUS_REPLIES = {0x69}
+
+
+class Command(NamedTuple):
+    name: str
+    args: tuple
+    num_bytes: int
+    sent: float  # simulated time at which the first byte went on the wire
+    on_screen: float  # simulated time at which the display finished drawing it
+
+
+class Label:
+    def __init__(self, x_pos: int, y_pos: int, width: int, height: int, font_id: int, fg_color: str):
+        self.x_pos, self.y_pos, self.width, self.height = x_pos, y_pos, width, height
+        self.font_id = font_id
+        self.fg_color = fg_color
+        self.text = ''
+
+
+class Bar:
+    def __init__(self, min_value: int, max_value: int, x_pos: int, y_pos: int, width: int, height: int,
+                 fg_color: str, bg_color: str, direction: int):
+        self.min_value, self.max_value = min_value, max_value
+        self.x_pos, self.y_pos, self.width, self.height = x_pos, y_pos, width, height
+        self.fg_color, self.bg_color = fg_color, bg_color
+        self.direction = direction
+        self.value = min_value
+
+
+class GttSimulator:
+    """
+    Write to it like a serial.Serial connected to the display, either directly by replacing a display's connection
+    or through a pseudo-terminal by calling serve() and opening the returned port.
+    """
+
+    def __init__(self, baud=115200, command_latency=0.0005):
+        """
+        :param baud: the simulated link speed. Each byte takes 10 bits on the wire.
+        :param command_latency: seconds the display takes to act on a command once it has been received
+        """
+        self.baud = baud
+        self.command_latency = command_latency
+
+        self.commands: List[Command] = []
+        self.unknown_bytes = 0
+        self.labels: Dict[int, Label] = {}
+        self.bars: Dict[int, Bar] = {}
+        self.regions: Dict[Tuple[int, int], tuple] = {}  # (x, y) -> ('rectangle', w, h, color, fill) or ('bitmap', id)
+        self.fonts: Dict[int, str] = {}
+        self.bitmaps: Dict[int, str] = {}
+        self.transparency: Dict[int, str] = {}
+        self.drawing_color = 'FFFFFF'
+
+        self.link_free_at = 0.0  # simulated time at which the link has sent everything written so far
+        self._pending = bytearray()
+        self._replies = bytearray()  # status replies which haven't been read yet
+        self._clock_start = time.monotonic()
+
+        self._stop = Event()
+        self._thread = None
+        self._master_fd = None
+        self._slave_fd = None
+
+    # serial.Serial look-alike so that the simulator can be used in place of a display's connection
+    timeout = None
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._replies)
+
+    def write(self, data: bytes, timestamp: float = None) -> int:
+        """
+        Feeds bytes to the simulated display
+
+        :param data: raw bytes as sent to the display
+        :param timestamp: when the bytes were written, in seconds. Defaults to the time since the simulator was made.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic() - self._clock_start
+
+        self.link_free_at = max(timestamp, self.link_free_at) + len(data) * 10 / self.baud
+        self._pending += data
+        self._decode()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self, size=1) -> bytes:
+        """:return: up to size bytes of the status replies to the commands written so far"""
+        data = bytes(self._replies[:size])
+        del self._replies[:size]
+        return data
+
+    def close(self):
+        self.stop()
+
+    @property
+    def bytes_received(self) -> int:
+        return sum(command.num_bytes for command in self.commands) + self.unknown_bytes
+
+    def _decode(self):
+        buf = self._pending
+        while buf:
+            if buf[0] != COMMAND_PREFIX:
+                skip = buf.find(COMMAND_PREFIX)
+                skip = len(buf) if skip < 0 else skip
+                self.unknown_bytes += skip
+                del buf[:skip]
+                continue
+
+            if len(buf) < 2:
+                return
+
+            if buf[1] not in COMMANDS:
+                self.unknown_bytes += 1
+                del buf[:1]
+                continue
+
+            name, layout, has_string = COMMANDS[buf[1]]
+            length = 2 + layout.size
+            if len(buf) < length:
+                return
+
+            args = layout.unpack_from(buf, 2)
+            if has_string:
+                end = buf.find(0, length)
+                if end < 0:
+                    return
+                args += (bytes(buf[length:end]).decode('ascii', 'replace'),)
+                length = end + 1
+
+            # a command reaches the display once its last byte has crossed the link.
+            # The buffer's last byte arrived when the link became free and the bytes before it arrived back to back.
+            byte_time = 10 / self.baud
+            received = self.link_free_at - (len(buf) - length) * byte_time
+            self.commands.append(Command(name, args, length, received - length * byte_time,
+                                         received + self.command_latency))
+            self._apply(name, args)
+            if buf[1] in STATUS_REPLIES:
+                self._replies += bytes([RESPONSE_PREFIX, buf[1]]) + (1).to_bytes(2, 'big') + bytes([STATUS_SUCCESS])
+            del buf[:length]
+
+    def _apply(self, name: str, args: tuple):
+        """Updates the scene with the effect of a command"""
+        if name == 'clear_screen':
+            self.labels.clear()
+            self.bars.clear()
+            self.regions.clear()
+        elif name == 'create_label':
+            label_id, x_pos, y_pos, width, height, _, _, _, font_id, fg_color = args
+            self.labels[label_id] = Label(x_pos, y_pos, width, height, font_id, fg_color.hex().upper())
+        elif name == 'update_label':
+            label_id, _, text = args
+            if label_id in self.labels:
+                self.labels[label_id].text = text
+        elif name == 'load_font':
+            self.fonts[args[0]] = args[1]
+        elif name == 'load_bitmap':
+            self.bitmaps[args[0]] = args[1]
+        elif name == 'set_bitmap_transparency':
+            self.transparency[args[0]] = args[1].hex().upper()
+        elif name == 'display_bitmap':
+            bitmap_id, x_pos, y_pos = args
+            self.regions[(x_pos, y_pos)] = ('bitmap', bitmap_id)
+        elif name == 'set_drawing_color':
+            self.drawing_color = args[0].hex().upper()
+        elif name in ('draw_rectangle', 'draw_filled_rectangle'):
+            x_pos, y_pos, width, height = args
+            self.regions[(x_pos, y_pos)] = ('rectangle', width, height, self.drawing_color,
+                                            name == 'draw_filled_rectangle')
+        elif name == 'create_plain_bar':
+            bar_id, min_value, max_value, x_pos, y_pos, width, height, fg_color, bg_color, direction = args
+            self.bars[bar_id] = Bar(min_value, max_value, x_pos, y_pos, width, height,
+                                    fg_color.hex().upper(), bg_color.hex().upper(), direction)
+        elif name == 'update_bar_value':
+            bar_id, value = args
+            if bar_id in self.bars:
+                self.bars[bar_id].value = value
+
+    def label_text(self, label_id: int) -> Optional[str]:
+        return self.labels[label_id].text if label_id in self.labels else None
+
+    def stats(self) -> Dict[str, Tuple[int, int]]:
+        """:return: the number of times each command was received and the total bytes they took up"""
+        out = {}
+        for command in self.commands:
+            count, num_bytes = out.get(command.name, (0, 0))
+            out[command.name] = (count + 1, num_bytes + command.num_bytes)
+
+        return out
+
+    def serve(self) -> str:
+        """
+        Starts reading commands from a pseudo-terminal in a background thread
+
+        :return: the path of the port to give to the display, e.g. RooibosDisplay(simulator.serve())
+        """
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+
+        self._stop.clear()
+        self._thread = Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return os.ttyname(self._slave_fd)
+
+    def _serve(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master_fd], [], [], 0.05)
+            if readable:
+                self.write(os.read(self._master_fd, 4096))
+                if self._replies:
+                    os.write(self._master_fd, self.read(len(self._replies)))
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            os.close(self._master_fd)
+            os.close(self._slave_fd)
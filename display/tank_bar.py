@@ -1,17 +1,13 @@
-from os import path
-
 from gtt import GttDisplay
 
 from display.element import Element
 
-FILE_PATH = 'refill.odo'
-AVERAGE_MPG = 45
 TANK_GALLONS = 4
 
 
 class TankBar(Element):
-    """Estimates the amount of fuel in the tank based on the odometer reading and displays it as a bar.
-    Can also display a low fuel warning.
+    """Displays the fuel left in the tank, as worked out by the fuel channels, as a bar.
+    Can also display a low fuel warning along with the range that's left.
     """
 
     def __init__(self, display: GttDisplay):
@@ -27,10 +23,7 @@ class TankBar(Element):
             value='Tank'
         )
 
-        with open(FILE_PATH) as odo_file:
-            self.last_refill_odo = float(odo_file.read().strip())
-
-        self.update(self.last_refill_odo, low_fuel_warning=True)
+        self.update(0, low_fuel_warning=True)
 
     def _redraw_bar(self):
         self.display.overwrite_bar(
@@ -39,15 +32,14 @@ class TankBar(Element):
             fg_color_hex=self.color, bg_color_hex='909090'
         )
 
-    def update(self, odometer_reading: float, low_fuel_warning=False):
-        """:param odometer_reading: the current odometer reading
-        :param low_fuel_warning: if set to True, the fuel estimation will be skipped and the bar will be red and empty
+    def update(self, tank_gallons: float, range_miles: float = None, low_fuel_warning=False):
+        """:param tank_gallons: the fuel left in the tank, e.g. the fuel_remaining_gallons channel
+        :param range_miles: how far the fuel left will go, e.g. the range_miles channel.
+            Shown in place of the label when the fuel is low.
+        :param low_fuel_warning: if set to True, the bar will be red and empty no matter how much fuel is left
         """
-
-        # TODO show remaining miles instead of a red bar when at the warning level
-        tank_gallons = TANK_GALLONS - (odometer_reading - self.last_refill_odo) / AVERAGE_MPG
-
-        if tank_gallons < 1.2 or low_fuel_warning:
+        low_fuel = tank_gallons < 1.2 or low_fuel_warning
+        if low_fuel:
             new_color = 'FF0000'
             tank_gallons = max(0.5, tank_gallons)
             tank_gallons = min(1.2, tank_gallons)
@@ -63,13 +55,11 @@ class TankBar(Element):
 
         self.display.update_bar_value(self.id, round(tank_gallons * 10))
 
-    def refill(self, odometer_reading: float):
-        """Similar to resetting a trip meter, calling this indicates that the tank has been refilled."""
-        self.last_refill_odo = odometer_reading
-
-        with open(FILE_PATH, 'w') as odo_file:
-            odo_file.truncate()
-            odo_file.seek(0)
-            odo_file.write(str(odometer_reading))
+        if low_fuel and range_miles is not None:
+            self.display.update_label('fuel', f'{range_miles:.0f}mi')
+        else:
+            self.display.update_label('fuel', 'Tank')
 
-        self.update(odometer_reading)
+    def refill(self):
+        """Shows a full tank. The fuel used is reset separately, see dashboard.refill."""
+        self.update(TANK_GALLONS)
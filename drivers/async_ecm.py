@@ -0,0 +1,262 @@
+"""
+An asyncio version of Ecm which polls the ECM on the event loop instead of in a separate process.
+
+The serial port is put in non-blocking mode and the event loop wakes the poller when response bytes arrive,
+so waiting for the ECM costs no CPU and the display can be driven from the same loop with RenderLoop.run_async().
+"""
+import asyncio
+import math
+import time
+from typing import AsyncIterator, Iterable, Optional
+
+from serial import Serial
+
+from drivers import tracing
+from drivers.decoding import DecodePlan, LiveDataSnapshot
+from drivers.ecm import (DEAD, LIVE_DATA_SAMPLE, MAX_RECONNECT_DELAY, MAX_TRANSIENT_ERRORS, MOCK_FRAME_PERIOD, OK,
+                         PORT_ERRORS, RECONNECT_DELAY, RECONNECTING, RETRYING, STARTING, STOPPED, TRANSIENT_ERRORS)
+from drivers.exceptions import FailedChecksum, NakResponse, NoResponse, UnknownResponse
+from drivers.link_stats import LinkStats
+from drivers.serial_protocol import LIVE_DATA_REQUEST, MessageReader
+
+
+class AsyncEcm:
+    def __init__(self, serial_port: str, live_data_dict: dict, mock=False, parameters: Iterable[str] = None,
+                 response_timeout=0.1):
+        """
+        :param serial_port: passed through to the serial.Serial constructor
+        :param live_data_dict: a dictionary containing info about all the available live data like location and format
+        :param mock: If set to true, the ECM's data is not requested and some old data I have lying around is used
+        :param parameters: the names of the live data parameters you are interested in.
+            If given, live_data will only contain these parameters. By default all parameters are available.
+        :param response_timeout: seconds to wait for a whole response before giving up on it
+        """
+        self.serial_port_str = serial_port
+        self.live_data_dict = live_data_dict
+        self.mock = mock
+        self.response_timeout = response_timeout
+
+        if parameters is not None:
+            live_data_dict = {name: live_data_dict[name] for name in parameters}
+        self.decode_plan = DecodePlan(live_data_dict)
+        self.conn = None
+        self.link_stats = LinkStats()  # nothing is recorded in mock mode
+        self.__reader = MessageReader()
+
+        self.__poll_task = None
+        self.__poller_state = STOPPED
+        self.__latest = None
+        self.__new_frame = asyncio.Event()
+        self.__seq = 0
+        self.__request_times = None  # when the last request was written and its response read, for tracing
+
+    def open_conn(self):
+        if self.conn:
+            self.conn.close()
+
+        self.__reader.reset()
+        if not self.mock:
+            self.conn = Serial(self.serial_port_str, timeout=0)  # reads return whatever has arrived straight away
+
+    def close_conn(self):
+        if self.conn:
+            self.conn.close()
+
+    async def begin_poll(self):
+        """
+        Starts a task on the running event loop which keeps live_data up to date.
+        Returns straight away. Use `await ecm.wait_for_frame(0)` to wait for the first frame.
+
+        Like Ecm.begin_poll(), transient errors are retried straight away and the port is reopened with backoff if
+        they keep happening or the port itself fails. Check health and data_age to find out whether live_data is current.
+        """
+        self.open_conn()
+        self.__latest = None
+        self.__poller_state = STARTING
+        self.__poll_task = asyncio.ensure_future(self.__poll())
+
+    async def end_poll(self):
+        """Stops the task started by begin_poll"""
+        if self.__poll_task:
+            self.__poll_task.cancel()
+            try:
+                await self.__poll_task
+            except asyncio.CancelledError:
+                pass
+            self.__poll_task = None
+
+        self.close_conn()
+
+    async def __poll(self):
+        transient_errors = 0
+        while True:
+            try:
+                await self.fetch_live_data()
+            except TRANSIENT_ERRORS:
+                # counted by link_stats. The next request usually gets through.
+                transient_errors += 1
+                if transient_errors < MAX_TRANSIENT_ERRORS:
+                    self.__poller_state = RETRYING
+                else:
+                    self.__poller_state = RECONNECTING
+                    await self.reconnect()
+                    transient_errors = 0
+                continue
+            except PORT_ERRORS:
+                self.link_stats.count('serial_errors')
+                self.__poller_state = RECONNECTING
+                await self.reconnect()
+                transient_errors = 0
+                continue
+
+            transient_errors = 0
+            self.__poller_state = OK
+
+    async def reconnect(self):
+        """Reopens the serial port, waiting a little longer after each attempt which fails"""
+        delay = RECONNECT_DELAY
+        try:
+            self.close_conn()
+        except PORT_ERRORS:
+            pass
+        self.conn = None
+
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                self.open_conn()
+            except PORT_ERRORS:
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            else:
+                self.link_stats.count('reconnects')
+                return
+
+    @property
+    def health(self) -> str:
+        """:return: one of STOPPED, STARTING, OK, RETRYING, RECONNECTING or DEAD, as for Ecm.health"""
+        if self.__poll_task is None:
+            return STOPPED
+        if self.__poll_task.done():
+            return DEAD
+
+        return self.__poller_state
+
+    @property
+    def data_age(self) -> float:
+        """:return: seconds since the newest frame was received, or infinity if none has been"""
+        return time.monotonic() - self.__latest.timestamp if self.__latest is not None else math.inf
+
+    @property
+    def live_data(self) -> Optional[LiveDataSnapshot]:
+        """:return: the newest live data received by the poller or None if there isn't any yet"""
+        return self.__latest
+
+    async def wait_for_frame(self, seq: int) -> LiveDataSnapshot:
+        """
+        :param seq: the sequence number of the last frame you have seen
+        :return: the newest live data once there is any newer than seq
+        :raises: whatever stopped the poller, if it stopped
+        """
+        while self.__latest is None or self.__latest.seq <= seq:
+            if self.__poll_task is None:
+                raise RuntimeError('wait_for_frame() requires begin_poll() to have been called')
+
+            new_frame = asyncio.ensure_future(self.__new_frame.wait())
+            await asyncio.wait([new_frame, self.__poll_task], return_when=asyncio.FIRST_COMPLETED)
+            new_frame.cancel()
+            if self.__poll_task.done():
+                self.__poll_task.result()
+
+        return self.__latest
+
+    async def frames(self) -> AsyncIterator[LiveDataSnapshot]:
+        """
+        Use as `async for live_data in ecm.frames():`.
+
+        While polling, each iteration gets the newest frame. Frames which arrived while the consumer was busy
+        are skipped, so a slow consumer is never handed a backlog of stale data.
+        Otherwise each iteration requests a frame, so the ECM is only asked as often as the consumer keeps up.
+        """
+        seq = 0
+        while True:
+            if self.__poll_task:
+                live_data = await self.wait_for_frame(seq)
+            else:
+                live_data = await self.fetch_live_data()
+
+            seq = live_data.seq
+            yield live_data
+
+    async def fetch_live_data(self) -> LiveDataSnapshot:
+        """Requests one frame from the ECM and makes it the newest live data"""
+        data = await self.__fetch_live_frame()
+        self.__seq += 1
+        self.__trace_request(seq=self.__seq)
+        self.__latest = LiveDataSnapshot(data, self.decode_plan, self.__seq, time.monotonic())
+
+        # wake everything waiting for this frame and start a new event for the next one
+        self.__new_frame.set()
+        self.__new_frame = asyncio.Event()
+        return self.__latest
+
+    async def __fetch_live_frame(self) -> bytes:
+        if self.mock:
+            await asyncio.sleep(MOCK_FRAME_PERIOD)
+            self.__request_times = None
+            return LIVE_DATA_SAMPLE
+
+        bytes_read = self.__reader.bytes_read
+        sent_at = time.perf_counter()
+        write_start = time.monotonic()
+        self.conn.write(LIVE_DATA_REQUEST)
+        written_at = time.monotonic()
+        try:
+            live_data = await self.__receive()
+        except (FailedChecksum, NakResponse, UnknownResponse, NoResponse) as error:
+            self.link_stats.record_error(error, len(LIVE_DATA_REQUEST), self.__reader.bytes_read - bytes_read)
+            # there won't be a frame to tag these with
+            self.__request_times = (write_start, written_at, time.monotonic())
+            self.__trace_request(error=type(error).__name__)
+            raise
+        self.__request_times = (write_start, written_at, time.monotonic())
+
+        self.link_stats.record_frame(time.perf_counter() - sent_at, len(LIVE_DATA_REQUEST),
+                                     self.__reader.bytes_read - bytes_read)
+        return live_data
+
+    def __trace_request(self, **args):
+        """Records the spans of the last request once it's known what to tag them with, e.g. the frame's seq"""
+        if self.__request_times is not None:
+            write_start, written_at, read_at = self.__request_times
+            tracing.complete('request write', write_start, written_at, **args)
+            tracing.complete('response read', written_at, read_at, **args)
+
+    async def __receive(self) -> bytes:
+        """Like MessageReader.receive() but waits for the port to become readable on the event loop"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.response_timeout
+        readable = asyncio.Event()
+
+        while True:
+            message = self.__reader.next_message()
+            if message is not None:
+                return message
+
+            data = self.conn.read(max(1, self.conn.in_waiting))
+            if data:
+                self.__reader.feed(data)
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise NoResponse()
+
+            # only watch the port while waiting on it since the callback fires for as long as there's unread data
+            readable.clear()
+            loop.add_reader(self.conn.fileno(), readable.set)
+            try:
+                await asyncio.wait_for(readable.wait(), remaining)
+            except asyncio.TimeoutError:
+                raise NoResponse() from None
+            finally:
+                loop.remove_reader(self.conn.fileno())
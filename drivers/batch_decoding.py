@@ -0,0 +1,129 @@
+"""
+Decodes many live data frames at once with NumPy for post-ride analysis.
+NumPy is only needed for this module, the rest of the driver works without it.
+It isn't in requirements.txt so the dashboard doesn't need it. Install it with
+    pip install -r requirements-analysis.txt
+"""
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+BYTE_ORDERS = {'little': '<', 'big': '>'}
+
+Columns = Dict[str, Union[np.ndarray, Dict[str, np.ndarray]]]
+
+
+def frames_to_array(frames: Iterable[bytes], frame_length: int) -> np.ndarray:
+    """
+    :param frames: raw live data buffers, all of the same length
+    :param frame_length: the length of each buffer
+    :return: an N x frame_length array of uint8
+    """
+    return np.frombuffer(b''.join(frames), dtype=np.uint8).reshape(-1, frame_length)
+
+
+class BatchDecoder:
+    """
+    The live data dictionary compiled into vectorized operations.
+    Each scalar parameter decodes to one float64 column which matches what DecodePlan produces frame by frame.
+    """
+
+    def __init__(self, live_data_dict: dict):
+        """
+        :param live_data_dict: a dictionary containing info about all the available live data like location and format
+        """
+        self.names = list(live_data_dict)
+        self._scalars: List[Tuple[str, List[int], np.dtype, bool, float, float, str]] = []
+        self._bitfields: List[Tuple[str, List[int], List[Tuple[int, str]]]] = []
+
+        for name, param_info in live_data_dict.items():
+            columns = [
+                column
+                for location in param_info['addresses']
+                for column in range(location['offset'], location['offset'] + location['num_bytes'])
+            ]
+
+            if param_info['type'] == 'scalar':
+                num_bytes = len(columns)
+                signed = param_info['signed']
+                if num_bytes in (1, 2, 4, 8):
+                    kind = 'i' if signed else 'u'
+                    dtype = np.dtype(f'{BYTE_ORDERS[param_info["endianness"]]}{kind}{num_bytes}')
+                else:
+                    dtype = None
+
+                self._scalars.append((
+                    name, columns, dtype, signed, param_info['scale_factor'], param_info['offset'],
+                    param_info['endianness']
+                ))
+            else:
+                # Bit i of the big endian value is bit i % 8 of the (i // 8)th byte from the end.
+                # Some bitfields describe more bits than they have bytes for and those bits are always off.
+                bit_columns = [
+                    ((len(columns) - 1 - bit_idx // 8) * 8 + bit_idx % 8 if bit_idx < 8 * len(columns) else None,
+                     bit_description)
+                    for bit_idx, bit_description in enumerate(param_info['bits'])
+                ]
+                self._bitfields.append((name, columns, bit_columns))
+
+    @staticmethod
+    def _gather(frames: np.ndarray, columns: List[int]) -> np.ndarray:
+        """:return: the given byte columns as a contiguous N x len(columns) array"""
+        if columns == list(range(columns[0], columns[0] + len(columns))):
+            return np.ascontiguousarray(frames[:, columns[0]: columns[0] + len(columns)])
+
+        return frames[:, columns]
+
+    @staticmethod
+    def _combine(data: np.ndarray, endianness: str, signed: bool) -> np.ndarray:
+        """Combines byte columns into integers for sizes which have no NumPy dtype"""
+        if endianness == 'little':
+            data = data[:, ::-1]
+
+        value = np.zeros(len(data), dtype=np.int64)
+        for column in data.T:
+            value = (value << 8) | column
+
+        if signed:
+            sign_bit = 1 << (8 * data.shape[1] - 1)
+            value = np.where(value >= sign_bit, value - 2 * sign_bit, value)
+
+        return value
+
+    def decode(self, frames: np.ndarray) -> Columns:
+        """
+        :param frames: an N x frame_length array of uint8 where each row is one live data buffer
+        :return: a dictionary where the key is a key from the live data dictionary and the value is either a float64
+            column for scalar parameters or a dictionary of bool columns for bitfields
+        """
+        if frames.dtype != np.uint8 or frames.ndim != 2:
+            raise ValueError('frames must be a 2-D array of uint8')
+
+        frames = np.ascontiguousarray(frames)
+
+        out = {}
+        for name, columns, dtype, signed, scale, offset, endianness in self._scalars:
+            if dtype is not None and columns == list(range(columns[0], columns[0] + len(columns))):
+                # read each value straight out of the frames without copying the bytes first
+                raw = np.ndarray(
+                    (len(frames),), dtype=dtype, buffer=frames, offset=columns[0], strides=(frames.strides[0],)
+                )
+            elif dtype is not None:
+                raw = self._gather(frames, columns).view(dtype).ravel()
+            else:
+                raw = self._combine(self._gather(frames, columns).astype(np.int64), endianness, signed)
+
+            value = raw.astype(np.float64)
+            value *= scale
+            value += offset
+            out[name] = value
+
+        for name, columns, bit_columns in self._bitfields:
+            bits = np.unpackbits(self._gather(frames, columns), axis=1, bitorder='little').view(np.bool_)
+            off = np.zeros(len(frames), dtype=np.bool_)
+            out[name] = {
+                bit_description: off if column is None else bits[:, column]
+                for column, bit_description in bit_columns
+            }
+
+        return {name: out[name] for name in self.names}
@@ -0,0 +1,171 @@
+"""
+Lets several processes share one ECM link.
+
+The broker owns the serial port and polls the ECM into a named shared memory FrameRing.
+Subscribers attach to the ring by name and read frames from it directly. They never write to the ring
+or talk to the broker, so any number of them can come and go at their own rate without slowing the poller down.
+The broker also publishes the health of its poller in the ring's status.
+
+Run the broker with
+    python -m drivers.broker --port /dev/ttyUSB0
+and use LiveDataSubscriber in place of an Ecm in the programs which want the live data.
+"""
+import math
+import time
+from argparse import ArgumentParser
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterable, List, Optional
+
+from drivers.decoding import DecodePlan, LiveDataSnapshot
+from drivers.ecm import DEAD, OK, RECONNECTING, RETRYING, STARTING, STOPPED, Ecm
+from drivers.frame_ring import Frame, FrameRing
+from drivers.live_data_schema import load_live_data_dict
+
+DEFAULT_RING_NAME = 'rooibos_live_data'
+HEALTH_STATES = (STOPPED, STARTING, OK, RETRYING, RECONNECTING, DEAD)  # indexed by the ring's status
+HEALTH_PERIOD = 0.1  # seconds between updates of the health published in the ring
+
+
+def run_broker(ecm: Ecm, ring_name=DEFAULT_RING_NAME, ring_slots=256, record_path: str = None, replace=False):
+    """
+    Polls the ECM into the named ring until interrupted
+
+    :param ring_slots: how many frames a subscriber can fall behind by before it starts missing frames
+    :param record_path: If given, every frame is also appended to a FrameRecorder log at this path
+    :param replace: If set to true, a ring left behind by a broker which didn't shut down cleanly is removed.
+        Don't do this while another broker is running.
+    """
+    if replace:
+        try:
+            stale = SharedMemory(ring_name)
+        except FileNotFoundError:
+            pass
+        else:
+            stale.close()
+            stale.unlink()
+
+    try:
+        ecm.begin_poll(ring_slots, record_path, ring_name=ring_name)
+    except FileExistsError:
+        ecm.close_conn()
+        raise FileExistsError(f'A ring called {ring_name} already exists. Is another broker running? '
+                              f'If not, use --replace to remove it.') from None
+
+    status_ring = FrameRing(ring_name, create=False)
+    try:
+        while True:
+            status_ring.status = HEALTH_STATES.index(ecm.health)
+            time.sleep(HEALTH_PERIOD)
+    finally:
+        # subscribers which are still attached see the broker stop
+        status_ring.status = HEALTH_STATES.index(STOPPED)
+        status_ring.close()
+        ecm.end_poll()
+
+
+class LiveDataSubscriber:
+    """
+    Reads the live data published by a broker. Has the same live_data, health, data_age and frames_since()
+    as an Ecm which is polling, so it can be used in its place.
+    """
+
+    def __init__(self, live_data_dict: dict, parameters: Iterable[str] = None, ring_name=DEFAULT_RING_NAME):
+        """
+        :param live_data_dict: a dictionary containing info about all the available live data like location and format
+        :param parameters: the names of the live data parameters you are interested in.
+            If given, live_data will only contain these parameters. By default all parameters are available.
+        :param ring_name: the name the broker was given
+        :raises FileNotFoundError: if the broker isn't running
+        """
+        if parameters is not None:
+            live_data_dict = {name: live_data_dict[name] for name in parameters}
+        self.decode_plan = DecodePlan(live_data_dict)
+
+        try:
+            self.ring = FrameRing(ring_name, create=False)
+        except FileNotFoundError:
+            raise FileNotFoundError(f'There is no ring called {ring_name}. Is the broker running?') from None
+
+        self.__cached_live_data = None
+
+    @property
+    def live_data(self) -> Optional[LiveDataSnapshot]:
+        """:return: the newest live data or None if the broker hasn't received any yet"""
+        cached = self.__cached_live_data
+        if cached is None or cached.seq != self.ring.latest_seq:
+            frame = self.ring.latest()
+            if frame is not None:
+                self.__cached_live_data = LiveDataSnapshot(frame.data, self.decode_plan, frame.seq, frame.timestamp)
+
+        return self.__cached_live_data
+
+    @property
+    def data_age(self) -> float:
+        """:return: seconds since the broker received the newest frame, or infinity if it hasn't received any"""
+        frame = self.ring.latest()
+        return time.monotonic() - frame.timestamp if frame else math.inf
+
+    @property
+    def health(self) -> str:
+        """
+        :return: the broker's Ecm.health, one of STOPPED, STARTING, OK, RETRYING, RECONNECTING or DEAD.
+            It is published every HEALTH_PERIOD seconds. If the broker was killed outright this is whatever
+            it published last, so check data_age as well.
+        """
+        return HEALTH_STATES[self.ring.status]
+
+    @property
+    def latest_seq(self) -> int:
+        return self.ring.latest_seq
+
+    def frames_since(self, seq: int) -> List[Frame]:
+        """
+        :param seq: the sequence number of the last frame you have seen, or 0 for every frame still available
+        :return: the raw frames received by the broker since seq, oldest first.
+            A gap in the sequence numbers means frames were dropped because they were not read in time.
+        """
+        return self.ring.since(seq)
+
+    def wait_for_frames(self, seq: int, timeout: float = None, poll_interval=0.002) -> List[Frame]:
+        """
+        Like frames_since() but waits for at least one new frame to arrive
+
+        :param timeout: the most seconds to wait. Waits forever by default.
+        :param poll_interval: seconds between checks of the ring. The ring has no way of signalling new frames.
+        :return: the new frames, or [] if the timeout expired
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.ring.latest_seq <= seq:
+            if end is not None and time.monotonic() >= end:
+                return []
+            time.sleep(poll_interval)
+
+        return self.ring.since(seq)
+
+    def close(self):
+        """Detaches from the ring. The broker keeps running."""
+        self.__cached_live_data = None
+        self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Polls the ECM and shares the live data with any number of other processes')
+    parser.add_argument('--port', default='/dev/ttyUSB0', help='the serial port the ECM is on')
+    parser.add_argument('--mock', action='store_true', help='use old ECM data instead of talking to the ECM')
+    parser.add_argument('--name', default=DEFAULT_RING_NAME, help='the name subscribers attach with')
+    parser.add_argument('--slots', type=int, default=256, help='how many frames subscribers can fall behind by')
+    parser.add_argument('--record', metavar='PATH', help='also record every frame to a log file')
+    parser.add_argument('--replace', action='store_true', help='remove a ring left behind by a broker which crashed')
+    args = parser.parse_args()
+
+    broker_ecm = Ecm(args.port, load_live_data_dict(), mock=args.mock, parameters=[])
+    try:
+        run_broker(broker_ecm, args.name, args.slots, args.record, args.replace)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,222 @@
+from collections.abc import Mapping
+from operator import itemgetter
+from struct import Struct
+from typing import Callable, Dict, List, Tuple
+
+from drivers import tracing
+
+STRUCT_CODES = {
+    (1, False): 'B',
+    (1, True): 'b',
+    (2, False): 'H',
+    (2, True): 'h',
+    (4, False): 'I',
+    (4, True): 'i',
+}
+
+BYTE_ORDERS = {'little': '<', 'big': '>'}
+
+
+class _ScalarGroup:
+    """A set of non-overlapping, single-address scalars which share an endianness and can be read with one Struct"""
+
+    def __init__(self, endianness: str):
+        self.endianness = endianness
+        self.end = 0
+        self.format = BYTE_ORDERS[endianness]
+        self.names: List[str] = []
+        self.scales: List[float] = []
+        self.offsets: List[float] = []
+
+    def fits(self, endianness: str, offset: int) -> bool:
+        return endianness == self.endianness and offset >= self.end
+
+    def add(self, name: str, param_info: dict, code: str):
+        location = param_info['addresses'][0]
+        self.format += 'x' * (location['offset'] - self.end) + code
+        self.end = location['offset'] + location['num_bytes']
+        self.names.append(name)
+        self.scales.append(param_info['scale_factor'])
+        self.offsets.append(param_info['offset'])
+
+
+class DecodePlan:
+    """
+    The live data dictionary compiled into a form which can decode a whole live data frame with a handful of
+    struct.unpack_from calls instead of walking the dictionary one parameter at a time.
+
+    The output of decode() is identical to parsing each parameter in the order of the live data dictionary.
+    """
+
+    def __init__(self, live_data_dict: dict):
+        """
+        :param live_data_dict: a dictionary containing info about all the available live data like location and format
+        """
+        self.names = list(live_data_dict)
+
+        groups: List[_ScalarGroup] = []
+        self._unstructured: List[str] = []  # parameters which are decoded one at a time rather than through a Struct
+        self._decoders: Dict[str, Callable[[bytes], object]] = {}
+
+        scalars = [(name, info) for name, info in live_data_dict.items() if info['type'] == 'scalar']
+        scalars.sort(key=lambda item: item[1]['addresses'][0]['offset'])
+        for name, param_info in scalars:
+            addresses = param_info['addresses']
+            code = STRUCT_CODES.get((addresses[0]['num_bytes'], param_info['signed']))
+            if len(addresses) > 1 or code is None:
+                self._unstructured.append(name)
+                self._decoders[name] = self._slow_scalar_decoder(
+                    self._slices(addresses), param_info['endianness'], param_info['signed'],
+                    param_info['scale_factor'], param_info['offset']
+                )
+                continue
+
+            self._decoders[name] = self._scalar_decoder(
+                Struct(BYTE_ORDERS[param_info['endianness']] + code), addresses[0]['offset'],
+                param_info['scale_factor'], param_info['offset']
+            )
+
+            for group in groups:
+                if group.fits(param_info['endianness'], addresses[0]['offset']):
+                    break
+            else:
+                group = _ScalarGroup(param_info['endianness'])
+                groups.append(group)
+
+            group.add(name, param_info, code)
+
+        for name, param_info in live_data_dict.items():
+            if param_info['type'] != 'scalar':
+                self._unstructured.append(name)
+                self._decoders[name] = self._bitfield_decoder(
+                    self._slices(param_info['addresses']), list(enumerate(param_info['bits']))
+                )
+
+        self._groups = [
+            (Struct(group.format), group.scales, group.offsets) for group in groups
+        ]
+
+        plan_order = [name for group in groups for name in group.names] + self._unstructured
+        positions = {name: idx for idx, name in enumerate(plan_order)}
+        order = [positions[name] for name in self.names]
+        if len(order) > 1:
+            self._reorder = itemgetter(*order)
+        else:
+            self._reorder = lambda values: [values[idx] for idx in order]
+
+        self.frame_length = max(
+            (location['offset'] + location['num_bytes']
+             for param_info in live_data_dict.values() for location in param_info['addresses']),
+            default=0
+        )
+
+    @staticmethod
+    def _slices(addresses: List[dict]) -> List[slice]:
+        return [slice(location['offset'], location['offset'] + location['num_bytes']) for location in addresses]
+
+    @staticmethod
+    def _scalar_decoder(struct: Struct, location: int, scale: float, offset: float) -> Callable[[bytes], float]:
+        def decode(live_data: bytes) -> float:
+            return float(struct.unpack_from(live_data, location)[0] * scale + offset)
+
+        return decode
+
+    @staticmethod
+    def _slow_scalar_decoder(slices: List[slice], endianness: str, signed: bool,
+                             scale: float, offset: float) -> Callable[[bytes], float]:
+        def decode(live_data: bytes) -> float:
+            param_data = b''.join(live_data[location] for location in slices)
+            return float(int.from_bytes(param_data, endianness, signed=signed) * scale + offset)
+
+        return decode
+
+    @staticmethod
+    def _bitfield_decoder(slices: List[slice], bits: List[Tuple[int, str]]) -> Callable[[bytes], Dict[str, bool]]:
+        if len(slices) == 1 and slices[0].stop - slices[0].start == 1:
+            location = slices[0].start
+
+            def read(live_data: bytes) -> int:
+                return live_data[location]
+        else:
+            def read(live_data: bytes) -> int:
+                return int.from_bytes(b''.join(live_data[location] for location in slices), 'big')
+
+        def decode(live_data: bytes) -> Dict[str, bool]:
+            param_data = read(live_data)
+            return {bit_description: bool((param_data >> bit_idx) & 1) for bit_idx, bit_description in bits}
+
+        return decode
+
+    def __contains__(self, name) -> bool:
+        return name in self._decoders
+
+    def decode_parameter(self, live_data: bytes, name: str):
+        """
+        Decodes a single parameter without touching the rest of the frame
+
+        :param live_data: the full live data buffer
+        :param name: the name of the bitfield or scalar parameter
+        :return: a float for scalar parameters or a dictionary of bools for bitfields
+        """
+        return self._decoders[name](live_data)
+
+    def decode(self, live_data: bytes) -> dict:
+        """
+        :param live_data: the full live data buffer
+        :return: a dictionary where the key is a key from the live data dictionary and the value is either a float
+            for scalar parameters or a dictionary of bools for bitfields
+        """
+        values = []
+        for struct, scales, offsets in self._groups:
+            raw = struct.unpack_from(live_data)
+            values += [float(value * scale + offset) for value, scale, offset in zip(raw, scales, offsets)]
+
+        for name in self._unstructured:
+            values.append(self._decoders[name](live_data))
+
+        return dict(zip(self.names, self._reorder(values)))
+
+
+class LiveDataSnapshot(Mapping):
+    """
+    A read-only mapping over one live data frame which holds onto the raw bytes and decodes each parameter
+    the first time it is read. Reading a handful of parameters from a snapshot is much cheaper than decoding all of them.
+    """
+
+    __slots__ = ('live_data', 'seq', 'timestamp', '_plan', '_cache')
+
+    def __init__(self, live_data: bytes, plan: DecodePlan, seq: int = None, timestamp: float = None):
+        """
+        :param live_data: the full live data buffer
+        :param plan: the decode plan for the parameters which should be available from this snapshot
+        :param seq: the sequence number of the frame if it came from a poller
+        :param timestamp: the time.monotonic() time at which the frame was received
+        """
+        self.live_data = live_data
+        self.seq = seq
+        self.timestamp = timestamp
+        self._plan = plan
+        self._cache = {}
+
+    def __getitem__(self, name: str):
+        try:
+            return self._cache[name]
+        except KeyError:
+            with tracing.span('decode', parameter=name, seq=self.seq):
+                value = self._plan.decode_parameter(self.live_data, name)
+            self._cache[name] = value
+            return value
+
+    def __iter__(self):
+        return iter(self._plan.names)
+
+    def __len__(self) -> int:
+        return len(self._plan.names)
+
+    def __contains__(self, name) -> bool:
+        return name in self._plan
+
+    def to_dict(self) -> dict:
+        """:return: every parameter decoded into a plain dictionary"""
+        with tracing.span('decode', seq=self.seq):
+            return self._plan.decode(self.live_data)
@@ -0,0 +1,209 @@
+"""
+Values computed from the live data, like the current gear or the remaining range, all worked out in one pass per frame.
+
+Each channel declares the live data parameters (or other channels) it is computed from.
+A channel is only recomputed when one of its inputs changed since the last frame.
+Integrals are stepped every frame since they depend on time passing as well.
+Their totals can be kept in a SavedTotals file so they carry on from where they were after a restart.
+"""
+import json
+import os
+import time
+from collections import ChainMap
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional, Sequence
+
+CC_PER_GALLON = 3785.41
+
+# Engine RPM per MPH in each gear. These are approximate and should be calibrated against your own bike.
+GEAR_RPM_PER_MPH = [118.0, 84.0, 67.0, 57.0, 51.0]
+INJECTOR_CC_PER_SECOND = 4.0  # flow of one injector while it is open
+CYLINDERS_PER_INJECTOR = 1
+
+
+class Channel:
+    """A value computed from other values"""
+
+    def __init__(self, name: str, inputs: Sequence[str], compute: Callable[..., float]):
+        """
+        :param name: what to call the value. Shouldn't clash with a live data parameter.
+        :param inputs: names of live data parameters or earlier channels which are passed to compute in this order
+        :param compute: works out the value of the channel from the inputs
+        """
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.compute = compute
+        self.value: Optional[float] = None
+        self._last_inputs = None
+
+    def step(self, input_values: tuple, dt: float) -> float:
+        if input_values != self._last_inputs:
+            self._last_inputs = input_values
+            self.value = self.compute(*input_values)
+
+        return self.value
+
+    def reset(self):
+        self.value = None
+        self._last_inputs = None
+
+
+class Integral(Channel):
+    """The running total over time of a rate computed from the inputs, e.g. gallons from gallons per second"""
+
+    def __init__(self, name: str, inputs: Sequence[str], rate: Callable[..., float], initial=0.0):
+        """
+        :param rate: works out the rate of change per second from the inputs
+        :param initial: the value of the total before anything has been added to it
+        """
+        super().__init__(name, inputs, rate)
+        self.initial = initial
+        self.value = initial
+        self._rate = 0.0
+
+    def step(self, input_values: tuple, dt: float) -> float:
+        # the rate from the previous frame held until this one
+        self.value += self._rate * dt
+        if input_values != self._last_inputs:
+            self._last_inputs = input_values
+            self._rate = self.compute(*input_values)
+
+        return self.value
+
+    def reset(self):
+        super().reset()
+        self.value = self.initial
+        self._rate = 0.0
+
+
+class LiveDataWithChannels(ChainMap):
+    """The channel values layered over the live data they were computed from, keeping its seq and timestamp"""
+
+    def __init__(self, channel_values: Mapping, live_data: Mapping):
+        super().__init__(channel_values, live_data)
+        self.seq = getattr(live_data, 'seq', None)
+        self.timestamp = getattr(live_data, 'timestamp', None)
+
+
+class DerivedChannels:
+    """Steps a set of channels forward one live data frame at a time"""
+
+    def __init__(self, channels: List[Channel]):
+        """:param channels: channels may only use channels which come before them as inputs"""
+        self.channels = channels
+        self.values: Dict[str, float] = {}
+        self._last_timestamp = None
+
+    def update(self, live_data: Mapping, timestamp: float = None) -> Dict[str, float]:
+        """
+        :param live_data: the latest live data, e.g. Ecm.live_data
+        :param timestamp: the time.monotonic() time of the live data. Defaults to live_data.timestamp if it has one
+            and otherwise to now.
+        :return: the value of every channel
+        """
+        if timestamp is None:
+            timestamp = getattr(live_data, 'timestamp', None)
+            if timestamp is None:
+                timestamp = time.monotonic()
+
+        dt = 0.0 if self._last_timestamp is None else max(0.0, timestamp - self._last_timestamp)
+        self._last_timestamp = timestamp
+
+        values = self.values
+        for channel in self.channels:
+            input_values = tuple(values[name] if name in values else live_data[name] for name in channel.inputs)
+            values[channel.name] = channel.step(input_values, dt)
+
+        return values
+
+    def reset(self, name: str, initial: float = None):
+        """
+        Starts a channel over, e.g. resetting the fuel used when the tank is refilled
+
+        :param initial: for an Integral, the total to start over from, now and on any later reset.
+            Defaults to the one it was created with.
+        """
+        for channel in self.channels:
+            if channel.name == name:
+                if initial is not None:
+                    channel.initial = initial
+                channel.reset()
+                self.values.pop(name, None)
+
+
+class SavedTotals:
+    """Keeps the totals of some Integrals in a small JSON file, e.g. the fuel used since the tank was last filled"""
+
+    def __init__(self, path: str, names: Sequence[str] = ('fuel_used_gallons', 'trip_miles')):
+        """
+        :param path: the file to keep the totals in
+        :param names: the channels whose totals are kept
+        """
+        self.path = path
+        self.names = tuple(names)
+
+    def load(self) -> Dict[str, float]:
+        """:return: the saved totals keyed by channel name. Empty if they have never been saved."""
+        try:
+            with open(self.path) as totals_file:
+                saved = json.load(totals_file)
+        except FileNotFoundError:
+            return {}
+
+        return {name: float(saved[name]) for name in self.names if name in saved}
+
+    def save(self, values: Mapping):
+        """
+        Writes the totals to a new file which then replaces the old one, so switching off part way through
+        a write can't lose them. Nothing is written unless every total has a value, e.g. before the first frame.
+
+        :param values: the channel values, e.g. DerivedChannels.values
+        """
+        if not all(name in values for name in self.names):
+            return
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as totals_file:
+            json.dump({name: values[name] for name in self.names}, totals_file)
+            totals_file.flush()
+            os.fsync(totals_file.fileno())
+        os.replace(temp_path, self.path)
+
+
+def estimate_gear(speed_mph: float, rpm: float) -> int:
+    """:return: the gear whose RPM per MPH is closest to the current ratio, or 0 if the bike is stopped or coasting"""
+    if speed_mph < 3 or rpm < 1000:
+        return 0
+
+    ratio = rpm / speed_mph
+    return min(range(len(GEAR_RPM_PER_MPH)), key=lambda idx: abs(GEAR_RPM_PER_MPH[idx] - ratio)) + 1
+
+
+def fuel_flow_cc_per_second(pulse_front_ms: float, pulse_rear_ms: float, rpm: float) -> float:
+    """Each injector fires once every two revolutions"""
+    injections_per_second = rpm / 60 / 2 * CYLINDERS_PER_INJECTOR
+    return (pulse_front_ms + pulse_rear_ms) / 1000 * INJECTOR_CC_PER_SECOND * injections_per_second
+
+
+def miles_per_gallon(miles: float, gallons: float) -> float:
+    return miles / gallons if gallons > 0 else 0.0
+
+
+def default_channels(tank_gallons: float, fuel_used_gallons=0.0, trip_miles=0.0) -> List[Channel]:
+    """
+    :param tank_gallons: how much fuel the tank holds when full
+    :param fuel_used_gallons: the fuel used since the tank was filled, e.g. from SavedTotals.load()
+    :param trip_miles: the miles ridden since the tank was filled
+    :return: the channels used by the dashboard
+    """
+    return [
+        Channel('estimated_gear', ['vehicle_speed_mph', 'engine_rpm'], estimate_gear),
+        Channel('fuel_flow_gph', ['fuel_pulse_front', 'fuel_pulse_rear', 'engine_rpm'],
+                lambda front, rear, rpm: fuel_flow_cc_per_second(front, rear, rpm) * 3600 / CC_PER_GALLON),
+        Integral('fuel_used_gallons', ['fuel_flow_gph'], lambda gph: gph / 3600, initial=fuel_used_gallons),
+        Integral('trip_miles', ['vehicle_speed_mph'], lambda mph: mph / 3600, initial=trip_miles),
+        Channel('instant_mpg', ['vehicle_speed_mph', 'fuel_flow_gph'], miles_per_gallon),
+        Channel('average_mpg', ['trip_miles', 'fuel_used_gallons'], miles_per_gallon),
+        Channel('fuel_remaining_gallons', ['fuel_used_gallons'], lambda used: max(0.0, tank_gallons - used)),
+        Channel('range_miles', ['fuel_remaining_gallons', 'average_mpg'], lambda gallons, mpg: gallons * mpg),
+    ]
@@ -1,10 +1,19 @@
-from typing import Dict
-from multiprocessing import Process, Queue
-from queue import Empty
-
-from serial import Serial
-
-from drivers.serial_protocol import receive_message, construct_message
+import math
+import signal
+import sys
+import time
+from multiprocessing import Process, RawValue
+from typing import Iterable, List, Optional
+
+from serial import Serial, SerialException
+
+from drivers import tracing
+from drivers.decoding import DecodePlan, LiveDataSnapshot
+from drivers.exceptions import FailedChecksum, NakResponse, NoResponse, UnknownResponse
+from drivers.frame_ring import Frame, FrameRing
+from drivers.link_stats import LinkStats
+from drivers.recorder import FrameRecorder
+from drivers.serial_protocol import LIVE_DATA_REQUEST, MessageReader
 
 LIVE_DATA_SAMPLE = b'\x18\x0e\x00\x00\x00\x00\x00\x00\x00\x00y*y*\xe4Q\xe4Q&\x00\x18\xe7' \
                    b'\x04+\x02k\x02f\x00\xe2\x00N\x07\xfc\x03\x00\x00\xe8\x03\xe8\x03\xe8\x03\xe8\x03\xdc\x03\xdc' \
@@ -13,26 +22,56 @@ LIVE_DATA_SAMPLE = b'\x18\x0e\x00\x00\x00\x00\x00\x00\x00\x00y*y*\xe4Q\xe4Q&\x00
                    b'\xffr\xff\xb3s\x18\x9b\x9a\x01O\n^\x00\x00\xb4k\xff\x9a\x00\x00K\x96R\x0c\x04\x0c\x04\x00'
 
 
+# Errors which only spoil one response. The next request usually goes through.
+TRANSIENT_ERRORS = (FailedChecksum, NakResponse, UnknownResponse, NoResponse)
+# Errors which mean the port itself has gone bad, e.g. because the USB adapter dropped out
+PORT_ERRORS = (SerialException, OSError)
+MAX_TRANSIENT_ERRORS = 5  # transient errors in a row before the port is reopened anyway
+RECONNECT_DELAY = 0.01  # seconds before the first attempt to reopen the port. Doubles after each failed attempt
+MAX_RECONNECT_DELAY = 1.0
+MOCK_FRAME_PERIOD = 0.1  # roughly how often the real ECM can send a frame at 9600 baud
+
+# what the poller is doing, as reported by Ecm.health
+STOPPED = 'stopped'  # not polling
+STARTING = 'starting'  # no frame received yet
+OK = 'ok'  # the last request got a frame
+RETRYING = 'retrying'  # the last request failed and is being retried
+RECONNECTING = 'reconnecting'  # the port is being reopened
+DEAD = 'dead'  # the polling process exited unexpectedly
+POLLER_STATES = (STARTING, OK, RETRYING, RECONNECTING)
+
+
 class Ecm:
-    def __init__(self, serial_port: str, live_data_dict: dict, mock=False):
+    def __init__(self, serial_port: str, live_data_dict: dict, mock=False, parameters: Iterable[str] = None):
         """
         :param serial_port: passed through to the serial.Serial constructor
         :param live_data_dict: a dictionary containing info about all the available live data like location and format
         :param mock: If set to true, the ECM's data is not requested and some old data I have lying around is used
+        :param parameters: the names of the live data parameters you are interested in.
+            If given, live_data will only contain these parameters. By default all parameters are available.
         """
         self.serial_port_str = serial_port
         self.live_data_dict = live_data_dict
         self.mock = mock
+
+        if parameters is not None:
+            live_data_dict = {name: live_data_dict[name] for name in parameters}
+        self.decode_plan = DecodePlan(live_data_dict)
         self.conn = None
+        self.__reader = MessageReader()
+        self.link_stats = LinkStats()  # shared with the polling process. Nothing is recorded in mock mode.
 
         self.__poll_process = None
-        self.__queue = Queue()
+        self.__poller_state = RawValue('i', 0)  # index into POLLER_STATES, shared with the polling process
+        self.__ring = None
         self.__cached_live_data = None
+        self.__request_times = None  # when the last request was written and its response read, for tracing
 
     def open_conn(self):
         if self.conn:
             self.conn.close()
 
+        self.__reader.reset()
         if not self.mock:
             self.conn = Serial(self.serial_port_str, timeout=0.1)
 
@@ -40,19 +79,109 @@ class Ecm:
         if self.conn:
             self.conn.close()
 
-    def begin_poll(self):
-        """Sets up a subprocess that makes sure that the latest live data is automatically available"""
+    def reconnect(self):
+        """Reopens the serial port, waiting a little longer after each attempt which fails"""
+        delay = RECONNECT_DELAY
+        try:
+            self.close_conn()
+        except PORT_ERRORS:
+            pass
+        self.conn = None
+
+        while True:
+            time.sleep(delay)
+            try:
+                self.open_conn()
+            except PORT_ERRORS:
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            else:
+                self.link_stats.count('reconnects')
+                return
+
+    @property
+    def health(self) -> str:
+        """:return: one of STOPPED, STARTING, OK, RETRYING, RECONNECTING or DEAD"""
+        poll_process = self.__poll_process
+        if not poll_process:
+            return STOPPED
+        if not poll_process.is_alive():
+            return DEAD
+
+        return POLLER_STATES[self.__poller_state.value]
+
+    @property
+    def data_age(self) -> float:
+        """:return: seconds since the poller received the newest frame, or infinity if it hasn't received any"""
+        ring = self.__ring
+        frame = ring.latest() if ring is not None else None
+        return time.monotonic() - frame.timestamp if frame else math.inf
+
+    def begin_poll(self, ring_slots=64, record_path: str = None, ring_name: str = None):
+        """
+        Sets up a subprocess that makes sure that the latest live data is automatically available.
+        The subprocess writes raw frames into a shared memory ring so handing them over costs no pickling or syscalls.
+
+        Transient errors like a bad checksum are retried straight away. If they keep happening or the port itself
+        fails the port is reopened, backing off up to MAX_RECONNECT_DELAY between attempts.
+        Check health and data_age to find out whether live_data is current.
+
+        :param ring_slots: how many of the most recent frames are kept around for frames_since()
+        :param record_path: If given, every frame is also appended to a FrameRecorder log at this path
+        :param ring_name: the name to give the shared memory ring so that other processes can attach to it.
+            A random name is used by default.
+        """
         self.open_conn()
+        self.__ring = FrameRing(ring_name, slots=ring_slots)
+        self.__cached_live_data = None
+        self.__poller_state.value = POLLER_STATES.index(STARTING)
+
+        def set_state(state: str):
+            self.__poller_state.value = POLLER_STATES.index(state)
 
         def poll():
-            while True:
-                data = self.__fetch_live_data()
-                try:
-                    self.__queue.get_nowait()
-                except Empty:
-                    pass
+            # terminate() sends SIGTERM. Exiting cleanly lets the recorder write out its index.
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+            tracing.name_process('ecm poll')
+            recorder = FrameRecorder(record_path) if record_path else None
 
-                self.__queue.put(data)
+            transient_errors = 0
+            try:
+                while True:
+                    if self.mock:
+                        # the sample is there straight away. Without this the poller would spin a core
+                        # and run far ahead of anything reading the ring.
+                        time.sleep(MOCK_FRAME_PERIOD)
+                    start = time.monotonic()
+                    try:
+                        data = self.__fetch_live_frame()
+                    except TRANSIENT_ERRORS:
+                        transient_errors += 1
+                        if transient_errors < MAX_TRANSIENT_ERRORS:
+                            set_state(RETRYING)
+                        else:
+                            set_state(RECONNECTING)
+                            self.reconnect()
+                            transient_errors = 0
+                        continue
+                    except PORT_ERRORS:
+                        self.link_stats.count('serial_errors')
+                        set_state(RECONNECTING)
+                        self.reconnect()
+                        transient_errors = 0
+                        continue
+
+                    transient_errors = 0
+                    set_state(OK)
+                    timestamp = time.monotonic()
+                    seq = self.__ring.write(data, timestamp)
+                    tracing.complete('fetch frame', start, timestamp, seq=seq)
+                    self.__trace_request(seq=seq)
+                    if recorder:
+                        recorder.write(data, timestamp)
+            finally:
+                if recorder:
+                    recorder.close()
+                tracing.flush()
 
         self.__poll_process = Process(target=poll)
         self.__poll_process.start()
@@ -66,99 +195,101 @@ class Ecm:
             self.__poll_process.join()
             self.__poll_process = None
 
+        if self.__ring:
+            self.__ring.close()
+            self.__ring.unlink()
+            self.__ring = None
+
     @property
-    def live_data(self) -> dict:
+    def live_data(self) -> Optional[LiveDataSnapshot]:
         """
-        :return: the live data from the ECM as a dictionary where the key is a key from the live data dictionary
-            and the value is the value of that datum.
+        :return: the live data from the ECM as a read-only mapping where the key is a key from the live data dictionary
+            and the value is the value of that datum. Values are only decoded when they are first read.
 
         This will be much quicker if begin_poll() and end_poll() are used.
+        While polling this never waits. It returns None until the poller has received a frame
+        and after that the newest frame even if it is old. Check health and data_age to find out whether it is current,
+        or use wait_for_frames() to wait for the first frame.
         """
-
-        if self.__poll_process:
-            try:
-                latest_data = self.__queue.get_nowait()
-                self.__cached_live_data = latest_data
-                return latest_data
-            except Empty:
-                if self.__cached_live_data:
-                    return self.__cached_live_data
-
-        return self.__fetch_live_data()
-
-    def __fetch_live_data(self) -> dict:
-        """
-        Requests the live data from the ECM and returns all of the data therein parsed and formatted as a dictionary.
+        ring = self.__ring
+        if self.__poll_process and ring is not None:
+            cached = self.__cached_live_data
+            if cached is None or cached.seq != ring.latest_seq:
+                frame = ring.latest()
+                if frame is not None:
+                    # from the frame arriving in the polling process to it being picked up here
+                    tracing.complete('poll handoff', frame.timestamp, seq=frame.seq)
+                    self.__cached_live_data = LiveDataSnapshot(frame.data, self.decode_plan, frame.seq, frame.timestamp)
+
+            return self.__cached_live_data
+
+        data = self.__fetch_live_frame()
+        self.__trace_request()
+        return LiveDataSnapshot(data, self.decode_plan, timestamp=time.monotonic())
+
+    def wait_for_frames(self, seq: int, timeout: float = None, poll_interval=0.002) -> List[Frame]:
         """
-        if self.mock:
-            live_data = LIVE_DATA_SAMPLE
-        else:
-            self.conn.write(construct_message(b'C'))
-            live_data = receive_message(self.conn)
-
-        out = {}
-        for param_name, param_info in self.live_data_dict.items():
-            if param_info['type'] == 'scalar':
-                out[param_name] = self.__parse_scalar(live_data, param_name)
-            else:
-                out[param_name] = self.__parse_bitfield(live_data, param_name)
-
-        return out
+        Like frames_since() but waits for at least one new frame to arrive
 
-    def __parse_scalar(self, live_data: bytes, name: str) -> float:
+        :param timeout: the most seconds to wait. Waits forever by default.
+        :param poll_interval: seconds between checks of the ring
+        :return: the new frames, or [] if the timeout expired
+        :raises RuntimeError: if the poller isn't running or dies while waiting
         """
-        Pulls the given scalar parameter out of the live data buffer and returns it as a float
-
-        :param live_data: the full live data buffer
-        :param name: the name of the scalar parameter
-        :return: the parameter's value as a float
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ring = self.__ring
+            if ring is None:
+                raise RuntimeError('wait_for_frames() requires the poller started by begin_poll() to be running')
+            if ring.latest_seq > seq:
+                return ring.since(seq)
+            if self.health == DEAD:
+                raise RuntimeError('The polling process exited')
+            if end is not None and time.monotonic() >= end:
+                return []
+            time.sleep(poll_interval)
+
+    def frames_since(self, seq: int) -> List[Frame]:
         """
-        param_data = self.__get_parameter_data(live_data, name)
-        param_info = self.live_data_dict[name]
-
-        if param_info['type'] != 'scalar':
-            raise ValueError(f'{name} is not a scalar parameter')
-
-        value = int.from_bytes(param_data, param_info['endianness'], signed=param_info['signed'])
-        value *= param_info['scale_factor']
-        value += param_info['offset']
-
-        return float(value)
-
-    def __parse_bitfield(self, live_data: bytes, name: str) -> Dict[str, bool]:
-        """
-        Pulls the values of the given bitfield out of the live data buffer
-
-        :param live_data: the full live data buffer
-        :param name: the name of the bitfield
-        :return: a dictionary where the key is the name of the bit and the value is the bit converted to a bool
+        :param seq: the sequence number of the last frame you have seen, or 0 for every frame still available
+        :return: the raw frames received by the poller since seq, oldest first.
+            A gap in the sequence numbers means frames were dropped because they were not read in time.
         """
-        param_data = self.__get_parameter_data(live_data, name)
-        param_info = self.live_data_dict[name]
-
-        if param_info['type'] != 'bitfield':
-            raise ValueError(f'{name} is not a bitfield parameter')
-
-        param_data = int.from_bytes(param_data, 'big')
+        if not self.__ring:
+            raise RuntimeError('frames_since() requires begin_poll() to have been called')
 
-        out = {}
-        for bit_idx, bit_description in enumerate(param_info['bits']):
-            bit_value = (param_data >> bit_idx) & 1
-            out[bit_description] = bool(bit_value)
+        return self.__ring.since(seq)
 
-        return out
-
-    def __get_parameter_data(self, live_data: bytes, parameter_name: str) -> bytes:
+    def __fetch_live_frame(self) -> bytes:
         """
-        Iterates over the addresses of the given parameter and puts together all the data for that parameter
-
-        :param live_data: the full live data buffer
-        :param parameter_name: the name of the bitfield or scalar parameter
-        :return: all of the bytes data for the given parameter
+        Requests the live data from the ECM and returns the raw live data buffer
         """
-        out = b''
-        for location in self.live_data_dict[parameter_name]['addresses']:
-            out += live_data[location['offset']: location['offset'] + location['num_bytes']]
-
-        return out
-
+        if self.mock:
+            self.__request_times = None
+            return LIVE_DATA_SAMPLE
+
+        bytes_read = self.__reader.bytes_read
+        sent_at = time.perf_counter()
+        write_start = time.monotonic()
+        self.conn.write(LIVE_DATA_REQUEST)
+        written_at = time.monotonic()
+        try:
+            live_data = self.__reader.receive(self.conn)
+        except (FailedChecksum, NakResponse, UnknownResponse, NoResponse) as error:
+            self.link_stats.record_error(error, len(LIVE_DATA_REQUEST), self.__reader.bytes_read - bytes_read)
+            # there won't be a frame to tag these with
+            self.__request_times = (write_start, written_at, time.monotonic())
+            self.__trace_request(error=type(error).__name__)
+            raise
+        self.__request_times = (write_start, written_at, time.monotonic())
+
+        self.link_stats.record_frame(time.perf_counter() - sent_at, len(LIVE_DATA_REQUEST),
+                                     self.__reader.bytes_read - bytes_read)
+        return live_data
+
+    def __trace_request(self, **args):
+        """Records the spans of the last request once it's known what to tag them with, e.g. the frame's seq"""
+        if self.__request_times is not None:
+            write_start, written_at, read_at = self.__request_times
+            tracing.complete('request write', write_start, written_at, **args)
+            tracing.complete('response read', written_at, read_at, **args)
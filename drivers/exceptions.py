@@ -8,3 +8,11 @@ class UnknownResponse(Exception):
 
 class FailedChecksum(Exception):
     """Raised when the response from the ECM does not have a correct checksum"""
+
+
+class NoResponse(Exception):
+    """Raised when the ECM does not send a complete response before the serial timeout"""
+
+
+class SchemaError(Exception):
+    """Raised when the live data dictionary has mistakes in it"""
@@ -0,0 +1,242 @@
+"""
+Exports a log written by FrameRecorder to CSV, Parquet or Arrow IPC for analysis tools.
+
+The log is split into chunks at keyframes and each chunk is read and decoded with BatchDecoder on its own,
+in a pool of processes if asked. Only a few chunks are in flight at once so memory use doesn't depend on
+the length of the ride.
+
+    python -m drivers.export ride.rlog ride.parquet -p engine_rpm -p vehicle_speed_mph
+
+NumPy is needed for this module and pyarrow is needed for Parquet and Arrow output. Install them with
+    pip install -r requirements-analysis.txt
+"""
+import io
+import os
+import re
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from drivers.batch_decoding import BatchDecoder, frames_to_array
+from drivers.live_data_schema import FRAME_LENGTH, load_live_data_dict
+from drivers.recorder import FrameLog
+
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+DEFAULT_CHUNK_FRAMES = 1 << 16
+
+Chunk = Dict[str, np.ndarray]  # flat columns: frame, timestamp, scalars, and one column per bitfield bit
+
+
+def _column_names(live_data_dict: dict) -> List[str]:
+    """:return: the flat column names with bitfields split into name.bit columns"""
+    names = ['frame', 'timestamp']
+    for name, param_info in live_data_dict.items():
+        if param_info['type'] == 'scalar':
+            names.append(name)
+        else:
+            names += [f'{name}.{bit}' for bit in dict.fromkeys(param_info['bits'])]
+
+    return names
+
+
+def read_chunk(log_path: str, live_data_dict: dict, start_time: Optional[float], end_time: Optional[float]) -> Chunk:
+    """
+    Decodes the frames of a log recorded from start_time up to end_time. Runs in the worker processes.
+
+    :param live_data_dict: only the parameters which should be exported
+    :return: flat columns in the order of _column_names(live_data_dict)
+    """
+    with FrameLog(log_path) as log:
+        frames = list(log.frames(start_time, end_time))
+
+    if frames:
+        data = frames_to_array((frame.data for frame in frames), len(frames[0].data))
+    else:
+        data = np.zeros((0, FRAME_LENGTH), dtype=np.uint8)
+    decoded = BatchDecoder(live_data_dict).decode(data)
+
+    chunk = {
+        'frame': np.fromiter((frame.seq for frame in frames), dtype=np.int64, count=len(frames)),
+        'timestamp': np.fromiter((frame.timestamp for frame in frames), dtype=np.float64, count=len(frames)),
+    }
+    for name, value in decoded.items():
+        if isinstance(value, dict):
+            chunk.update({f'{name}.{bit}': column for bit, column in value.items()})
+        else:
+            chunk[name] = value
+
+    return chunk
+
+
+def _csv_format(param_info: dict) -> str:
+    """:return: the printf style equivalent of a parameter's format_string, e.g. %.1f for 0.1f"""
+    match = re.fullmatch(r'0?\.(\d+)f', param_info.get('format_string', ''))
+    return f'%.{match.group(1)}f' if match else '%.17g'
+
+
+def format_csv_chunk(log_path: str, live_data_dict: dict, start_time: Optional[float], end_time: Optional[float]) -> str:
+    """Like read_chunk but formats the rows as CSV in the worker so that the main process only has to write them"""
+    chunk = read_chunk(log_path, live_data_dict, start_time, end_time)
+
+    formats = ['%d', '%.6f']
+    for param_info in live_data_dict.values():
+        if param_info['type'] == 'scalar':
+            formats.append(_csv_format(param_info))
+        else:
+            formats += ['%d'] * len(dict.fromkeys(param_info['bits']))
+
+    out = io.StringIO()
+    columns = [column.astype(np.uint8) if column.dtype == np.bool_ else column for column in chunk.values()]
+    np.savetxt(out, np.column_stack(columns) if columns[0].size else np.zeros((0, len(columns))),
+               fmt=formats, delimiter=',')
+    return out.getvalue()
+
+
+def _chunk_ranges(log_path: str, chunk_frames: int, start_time: float = None,
+                  end_time: float = None) -> List[Tuple[Optional[float], Optional[float]]]:
+    with FrameLog(log_path) as log:
+        times = log.chunk_times(chunk_frames)
+
+    ranges = []
+    for chunk_start, chunk_end in zip(times, times[1:] + [None]):
+        if start_time is not None:
+            if chunk_end is not None and chunk_end <= start_time:
+                continue
+            chunk_start = max(chunk_start, start_time)
+        if end_time is not None:
+            if chunk_start >= end_time:
+                break
+            chunk_end = end_time if chunk_end is None else min(chunk_end, end_time)
+
+        ranges.append((chunk_start, chunk_end))
+
+    return ranges
+
+
+def _run_in_order(executor: Optional[Executor], function, jobs: Iterable[tuple], max_in_flight: int) -> Iterator:
+    """Runs function on each job in the executor, or here if there isn't one, keeping only a few results in memory"""
+    if executor is None:
+        for job in jobs:
+            yield function(*job)
+        return
+
+    in_flight = deque()
+    for job in jobs:
+        in_flight.append(executor.submit(function, *job))
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def _arrow_schema(live_data_dict: dict):
+    import pyarrow as pa
+
+    fields = [pa.field('frame', pa.int64()), pa.field('timestamp', pa.float64(), metadata={'units': 'Seconds'})]
+    for name, param_info in live_data_dict.items():
+        if param_info['type'] == 'scalar':
+            fields.append(pa.field(name, pa.float64(), metadata={'units': param_info['units']}))
+        else:
+            fields += [pa.field(f'{name}.{bit}', pa.bool_()) for bit in dict.fromkeys(param_info['bits'])]
+
+    return pa.schema(fields)
+
+
+def export_log(log_path: str, out_path: str, parameters: Iterable[str] = None, out_format: str = None,
+               live_data_dict: dict = None, chunk_frames=DEFAULT_CHUNK_FRAMES, workers: int = None,
+               start_time: float = None, end_time: float = None) -> int:
+    """
+    :param log_path: a log written by FrameRecorder
+    :param out_path: the file to write
+    :param parameters: the live data parameters to export. All of them by default.
+    :param out_format: csv, parquet or arrow. Worked out from the extension of out_path by default.
+    :param live_data_dict: defaults to the one in drivers/live_data.json
+    :param chunk_frames: roughly how many frames to decode at a time
+    :param workers: how many processes to decode in. 0 decodes in this process.
+        Defaults to one per CPU, or 0 if there is only one CPU.
+    :param start_time: skip frames recorded before this time.monotonic() time
+    :param end_time: skip frames recorded at or after this time.monotonic() time
+    :return: how many frames were exported
+    """
+    if out_format is None:
+        extension = out_path[out_path.rfind('.'):].lower()
+        if extension not in FORMATS:
+            raise ValueError(f"Can't tell the format of {out_path}. Give one of {', '.join(sorted(set(FORMATS.values())))}")
+        out_format = FORMATS[extension]
+
+    if live_data_dict is None:
+        live_data_dict = load_live_data_dict()
+    if parameters is not None:
+        live_data_dict = {name: live_data_dict[name] for name in parameters}
+
+    jobs = [(log_path, live_data_dict, chunk_start, chunk_end)
+            for chunk_start, chunk_end in _chunk_ranges(log_path, chunk_frames, start_time, end_time)]
+
+    if workers is None:
+        # shipping chunks between processes only pays off if they can actually run side by side
+        workers = os.cpu_count() or 1
+        workers = 0 if workers == 1 else workers
+    executor = ProcessPoolExecutor(workers) if workers else None
+    max_in_flight = 2 * max(workers, 1)
+    num_frames = 0
+
+    try:
+        if out_format == 'csv':
+            with open(out_path, 'w') as out_file:
+                header = [
+                    f'{name} ({live_data_dict[name]["units"]})' if live_data_dict.get(name, {}).get('units') else name
+                    for name in _column_names(live_data_dict)
+                ]
+                out_file.write(','.join(header) + '\n')
+                for rows in _run_in_order(executor, format_csv_chunk, jobs, max_in_flight):
+                    out_file.write(rows)
+                    num_frames += rows.count('\n')
+        else:
+            import pyarrow as pa
+
+            schema = _arrow_schema(live_data_dict)
+            if out_format == 'parquet':
+                import pyarrow.parquet as pq
+                writer = pq.ParquetWriter(out_path, schema)
+            elif out_format == 'arrow':
+                writer = pa.ipc.new_file(out_path, schema)
+            else:
+                raise ValueError(f'Unknown format {out_format}')
+
+            with writer:
+                for chunk in _run_in_order(executor, read_chunk, jobs, max_in_flight):
+                    writer.write_batch(pa.record_batch(list(chunk.values()), schema=schema))
+                    num_frames += len(chunk['frame'])
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return num_frames
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Exports a recorded frame log to CSV, Parquet or Arrow')
+    parser.add_argument('log', help='a log written by FrameRecorder, e.g. by Ecm.begin_poll(record_path=...)')
+    parser.add_argument('out', help='the file to write. The extension picks the format unless --format is given.')
+    parser.add_argument('-p', '--parameter', action='append', dest='parameters',
+                        help='a live data parameter to export. Can be given more than once. Defaults to all of them.')
+    parser.add_argument('--format', choices=sorted(set(FORMATS.values())))
+    parser.add_argument('--chunk-frames', type=int, default=DEFAULT_CHUNK_FRAMES, help='frames to decode at a time')
+    parser.add_argument('--workers', type=int, help='processes to decode in. 0 decodes in this one. Default: one per CPU')
+    parser.add_argument('--start', type=float, help='seconds into the log to start at')
+    parser.add_argument('--end', type=float, help='seconds into the log to stop at')
+    args = parser.parse_args()
+
+    with FrameLog(args.log) as frame_log:
+        log_start = frame_log.start_time or 0.0
+
+    exported = export_log(
+        args.log, args.out, args.parameters, args.format, chunk_frames=args.chunk_frames, workers=args.workers,
+        start_time=None if args.start is None else log_start + args.start,
+        end_time=None if args.end is None else log_start + args.end,
+    )
+    print(f'Exported {exported} frames to {args.out}')
@@ -0,0 +1,160 @@
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from struct import Struct
+from typing import List, NamedTuple, Optional
+
+HEADER = Struct('<QIII4x')  # latest sequence number, number of slots, frame capacity, status
+SLOT_HEADER = Struct('<QQdI4x')  # sequence number at start of write, sequence number at end of write, timestamp, length
+SEQ = Struct('<Q')
+STATUS = Struct('<I')
+STATUS_OFFSET = 16
+
+
+class Frame(NamedTuple):
+    seq: int
+    timestamp: float
+    data: bytes
+
+
+class FrameRing:
+    """
+    A fixed size ring of raw live data frames in shared memory.
+    One process writes frames into the ring and any number of processes can read them without locks or pickling.
+
+    Every slot is guarded like a seqlock: the writer stamps the slot's sequence number before and after copying
+    the frame in, and a reader only accepts a copy of the slot if both stamps match the sequence number it expected.
+    Sequence numbers start at 1 and increase by one for every frame written, so readers can detect dropped frames.
+    """
+
+    def __init__(self, name: str = None, slots: int = 64, frame_capacity: int = 256, create=True):
+        """
+        :param name: the name of the shared memory block. A random name is picked when creating a ring without one.
+        :param slots: the number of frames which the ring can hold before the oldest frame gets overwritten
+        :param frame_capacity: the maximum length in bytes of a single frame
+        :param create: If set to true, a new ring is created. Otherwise an existing ring called name is attached to.
+        """
+        if create:
+            self.slots = slots
+            self.frame_capacity = frame_capacity
+            self.shm = SharedMemory(name, create=True, size=HEADER.size + slots * self._slot_size(frame_capacity))
+            HEADER.pack_into(self.shm.buf, 0, 0, slots, frame_capacity, 0)
+        else:
+            self.shm = self._attach(name)
+            _, self.slots, self.frame_capacity, _ = HEADER.unpack_from(self.shm.buf)
+
+        self.name = self.shm.name
+        self._slot_size_bytes = self._slot_size(self.frame_capacity)
+        self._write_seq = self.latest_seq
+
+    @staticmethod
+    def _attach(name: str) -> SharedMemory:
+        # Before Python 3.13 attaching to shared memory also registers it with the resource tracker,
+        # which would delete the ring out from under its creator when this process exits
+        try:
+            return SharedMemory(name, track=False)
+        except TypeError:
+            shm = SharedMemory(name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            return shm
+
+    @staticmethod
+    def _slot_size(frame_capacity: int) -> int:
+        return SLOT_HEADER.size + frame_capacity
+
+    def _slot_offset(self, seq: int) -> int:
+        return HEADER.size + (seq % self.slots) * self._slot_size_bytes
+
+    @property
+    def latest_seq(self) -> int:
+        """:return: the sequence number of the newest frame in the ring or 0 if nothing has been written yet"""
+        return SEQ.unpack_from(self.shm.buf)[0]
+
+    @property
+    def status(self) -> int:
+        """:return: a number the writer publishes alongside the frames, e.g. what its ECM poller is doing. 0 at first."""
+        return STATUS.unpack_from(self.shm.buf, STATUS_OFFSET)[0]
+
+    @status.setter
+    def status(self, value: int):
+        STATUS.pack_into(self.shm.buf, STATUS_OFFSET, value)
+
+    def write(self, frame: bytes, timestamp: float = None) -> int:
+        """
+        Copies a frame into the oldest slot of the ring. Only one process may write to a ring.
+
+        :param frame: the raw live data buffer
+        :param timestamp: when the frame was received. Defaults to time.monotonic()
+        :return: the sequence number given to the frame
+        """
+        if len(frame) > self.frame_capacity:
+            raise ValueError(f'Frame of {len(frame)} bytes does not fit in a {self.frame_capacity} byte slot')
+
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        self._write_seq += 1
+        seq = self._write_seq
+        offset = self._slot_offset(seq)
+        buf = self.shm.buf
+
+        SEQ.pack_into(buf, offset, seq)
+        payload_offset = offset + SLOT_HEADER.size
+        buf[payload_offset: payload_offset + len(frame)] = frame
+        SLOT_HEADER.pack_into(buf, offset, seq, seq, timestamp, len(frame))
+        SEQ.pack_into(buf, 0, seq)
+
+        return seq
+
+    def read(self, seq: int) -> Optional[Frame]:
+        """
+        :param seq: the sequence number of the frame to read
+        :return: the frame or None if it has been overwritten (or is being overwritten) by a newer frame
+        """
+        offset = self._slot_offset(seq)
+        buf = self.shm.buf
+
+        _, end_seq, timestamp, length = SLOT_HEADER.unpack_from(buf, offset)
+        payload_offset = offset + SLOT_HEADER.size
+        data = bytes(buf[payload_offset: payload_offset + min(length, self.frame_capacity)])
+        start_seq = SEQ.unpack_from(buf, offset)[0]
+
+        if start_seq != seq or end_seq != seq:
+            return None
+
+        return Frame(seq, timestamp, data)
+
+    def latest(self) -> Optional[Frame]:
+        """:return: the newest frame in the ring or None if nothing has been written yet"""
+        while True:
+            seq = self.latest_seq
+            if seq == 0:
+                return None
+
+            frame = self.read(seq)
+            if frame is not None:
+                return frame
+
+    def since(self, seq: int) -> List[Frame]:
+        """
+        :param seq: the sequence number of the last frame you have seen
+        :return: all frames newer than seq which are still in the ring, oldest first.
+            Gaps in the sequence numbers are frames which were overwritten before they could be read.
+        """
+        latest_seq = self.latest_seq
+        first_seq = max(seq + 1, latest_seq - self.slots + 1, 1)
+
+        out = []
+        for frame_seq in range(first_seq, latest_seq + 1):
+            frame = self.read(frame_seq)
+            if frame is not None:
+                out.append(frame)
+
+        return out
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        """Frees the shared memory. Should only be called by the process which created the ring."""
+        self.shm.unlink()
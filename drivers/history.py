@@ -0,0 +1,235 @@
+"""
+A fixed size history of selected live data parameters for things like peak markers, trends and smoothing.
+
+Recent frames are kept as raw samples and every frame is also folded into min/max/mean rollups at coarser
+resolutions (1 s and 10 s by default). Each is a ring of preallocated arrays with one column per parameter,
+so memory use is fixed no matter how long the ride is.
+
+Feed it from a polling Ecm (or a LiveDataSubscriber) with `history.update_from(ecm)` every so often.
+"""
+import math
+from array import array
+from typing import Dict, List, Mapping, NamedTuple, Sequence, Tuple
+
+from drivers.decoding import DecodePlan
+
+
+class Summary(NamedTuple):
+    min: float
+    max: float
+    mean: float
+    count: int
+
+
+EMPTY_SUMMARY = Summary(math.nan, math.nan, math.nan, 0)
+
+
+class Rollup:
+    """Min, max, sum and count of each column over consecutive time buckets of a fixed length"""
+
+    def __init__(self, resolution: float, num_buckets: int, num_columns: int):
+        """
+        :param resolution: the length of each bucket in seconds
+        :param num_buckets: how many buckets are kept. The oldest is reused once they are all full.
+        """
+        self.resolution = resolution
+        self.num_buckets = num_buckets
+        self.bucket_ids = array('q', [-1] * num_buckets)  # which bucket number each slot currently holds
+        self.counts = array('q', [0] * num_buckets)
+        self.mins = [array('d', [0.0] * num_buckets) for _ in range(num_columns)]
+        self.maxes = [array('d', [0.0] * num_buckets) for _ in range(num_columns)]
+        self.sums = [array('d', [0.0] * num_buckets) for _ in range(num_columns)]
+
+    def add(self, values: Sequence[float], timestamp: float):
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.num_buckets
+
+        if self.bucket_ids[slot] != bucket:
+            self.bucket_ids[slot] = bucket
+            self.counts[slot] = 1
+            for column, value in enumerate(values):
+                self.mins[column][slot] = self.maxes[column][slot] = self.sums[column][slot] = value
+            return
+
+        self.counts[slot] += 1
+        for column, value in enumerate(values):
+            if value < self.mins[column][slot]:
+                self.mins[column][slot] = value
+            if value > self.maxes[column][slot]:
+                self.maxes[column][slot] = value
+            self.sums[column][slot] += value
+
+    def holds(self, bucket: int) -> bool:
+        return self.bucket_ids[bucket % self.num_buckets] == bucket
+
+    def summary(self, column: int, bucket: int) -> Summary:
+        slot = bucket % self.num_buckets
+        if self.bucket_ids[slot] != bucket:
+            return EMPTY_SUMMARY
+
+        count = self.counts[slot]
+        return Summary(self.mins[column][slot], self.maxes[column][slot], self.sums[column][slot] / count, count)
+
+
+def combine(first: Summary, second: Summary) -> Summary:
+    if not first.count:
+        return second
+    if not second.count:
+        return first
+
+    count = first.count + second.count
+    return Summary(min(first.min, second.min), max(first.max, second.max),
+                   (first.mean * first.count + second.mean * second.count) / count, count)
+
+
+class History:
+    def __init__(self, live_data_dict: dict, parameters: Sequence[str], raw_capacity=1024,
+                 rollups: Sequence[Tuple[float, int]] = ((1.0, 600), (10.0, 720))):
+        """
+        :param live_data_dict: a dictionary containing info about all the available live data like location and format
+        :param parameters: the scalar parameters to keep a history of
+        :param raw_capacity: how many of the most recent frames to keep every sample of
+        :param rollups: (resolution in seconds, number of buckets) for each rollup, finest first.
+            Each resolution must be a whole multiple of the one before it.
+            The defaults keep 10 minutes at 1 s and 2 hours at 10 s.
+        """
+        for name in parameters:
+            if live_data_dict[name]['type'] != 'scalar':
+                raise ValueError(f'{name} is a {live_data_dict[name]["type"]}. Only scalars can have a history.')
+        for finer, coarser in zip(rollups, rollups[1:]):
+            if coarser[0] / finer[0] != round(coarser[0] / finer[0]):
+                raise ValueError(f'A {coarser[0]} s rollup is not a whole number of {finer[0]} s rollups')
+
+        self.parameters = list(parameters)
+        self.columns = {name: column for column, name in enumerate(self.parameters)}
+        self.decode_plan = DecodePlan({name: live_data_dict[name] for name in self.parameters})
+        self.last_seq = 0
+
+        self.raw_capacity = raw_capacity
+        self.timestamps = array('d', [0.0] * raw_capacity)
+        self.samples = [array('d', [0.0] * raw_capacity) for _ in self.parameters]
+        self.num_samples = 0  # ever added. The newest sample is at (num_samples - 1) % raw_capacity
+
+        self.rollups = [Rollup(resolution, num_buckets, len(self.parameters)) for resolution, num_buckets in rollups]
+        # how many of the finest buckets fit in a bucket of each rollup
+        self._spans = [round(rollup.resolution / self.rollups[0].resolution) for rollup in self.rollups]
+
+    def add(self, values: Mapping[str, float], timestamp: float):
+        """
+        :param values: a value for every parameter, e.g. a LiveDataSnapshot
+        :param timestamp: the time.monotonic() time of the values. Must not go backwards.
+        """
+        row = [values[name] for name in self.parameters]
+
+        slot = self.num_samples % self.raw_capacity
+        self.timestamps[slot] = timestamp
+        for column, value in enumerate(row):
+            self.samples[column][slot] = value
+        self.num_samples += 1
+
+        for rollup in self.rollups:
+            rollup.add(row, timestamp)
+
+    def add_frame(self, data: bytes, timestamp: float):
+        """:param data: a raw live data buffer"""
+        self.add(self.decode_plan.decode(data), timestamp)
+
+    def update_from(self, source) -> int:
+        """
+        Adds the frames a poller has received since the last call
+
+        :param source: anything with frames_since(), e.g. an Ecm which is polling or a LiveDataSubscriber
+        :return: how many frames were added
+        """
+        frames = source.frames_since(self.last_seq)
+        for frame in frames:
+            self.add_frame(frame.data, frame.timestamp)
+        if frames:
+            self.last_seq = frames[-1].seq
+
+        return len(frames)
+
+    @property
+    def latest_timestamp(self) -> float:
+        return self.timestamps[(self.num_samples - 1) % self.raw_capacity] if self.num_samples else math.nan
+
+    def latest(self, name: str) -> float:
+        if not self.num_samples:
+            return math.nan
+
+        return self.samples[self.columns[name]][(self.num_samples - 1) % self.raw_capacity]
+
+    def recent(self, name: str, count: int) -> List[Tuple[float, float]]:
+        """:return: up to count of the newest raw (timestamp, value) samples, oldest first"""
+        count = min(count, self.num_samples, self.raw_capacity)
+        column = self.samples[self.columns[name]]
+        slots = [(self.num_samples - count + idx) % self.raw_capacity for idx in range(count)]
+        return [(self.timestamps[slot], column[slot]) for slot in slots]
+
+    def window(self, name: str, seconds: float, end: float = None) -> Summary:
+        """
+        Works out the min, max and mean over a window from the rollups without looking at the raw samples.
+        The window is rounded out to whole buckets of the finest rollup. The coarser rollups are used for the
+        buckets which lie wholly inside it, so a long window takes about as many steps as it has coarsest buckets
+        plus a few finer ones at each end. Where only a coarser rollup still holds the start of a long window,
+        the window starts at the first of its buckets which lies wholly inside.
+
+        :param seconds: how far back the window goes
+        :param end: the time.monotonic() time the window ends at. Defaults to the newest sample.
+        """
+        if not self.num_samples:
+            return EMPTY_SUMMARY
+        latest = self.latest_timestamp
+        if end is None:
+            end = latest
+
+        column = self.columns[name]
+        finest = self.rollups[0]
+        last_bucket = int(end // finest.resolution)
+        bucket = int((end - seconds) // finest.resolution)
+        # the oldest bucket each rollup still holds, counted in its own buckets
+        oldest_kept = [int(latest // rollup.resolution) - rollup.num_buckets + 1 for rollup in self.rollups]
+        coarsest_span = self._spans[-1]
+        bucket = max(bucket, oldest_kept[-1] * coarsest_span)
+
+        summary = EMPTY_SUMMARY
+        while bucket <= last_bucket:
+            step = 1
+            # the coarsest rollup which still holds this part of the window and has a bucket which fits in it
+            for rollup, span, oldest in zip(reversed(self.rollups), reversed(self._spans), reversed(oldest_kept)):
+                rollup_bucket = bucket // span
+                if rollup_bucket < oldest:
+                    continue
+
+                if not rollup.holds(rollup_bucket):
+                    # nothing was added during this whole bucket
+                    step = (rollup_bucket + 1) * span - bucket
+                    break
+                if bucket % span == 0 and bucket + span - 1 <= last_bucket:
+                    summary = combine(summary, rollup.summary(column, rollup_bucket))
+                    step = span
+                    break
+
+            bucket += step
+
+        return summary
+
+    def trend(self, name: str, resolution: float, seconds: float) -> List[Tuple[float, Summary]]:
+        """
+        :param resolution: which rollup to read from, e.g. 10 for the 10 s rollup
+        :param seconds: how far back from the newest sample to go
+        :return: (bucket start time, summary) for each bucket with samples in it, oldest first
+        """
+        rollups: Dict[float, Rollup] = {rollup.resolution: rollup for rollup in self.rollups}
+        rollup = rollups[resolution]
+        column = self.columns[name]
+        if not self.num_samples:
+            return []
+
+        end = self.latest_timestamp
+        first_bucket = max(int((end - seconds) // resolution), int(end // resolution) - rollup.num_buckets + 1)
+        return [
+            (bucket * resolution, rollup.summary(column, bucket))
+            for bucket in range(first_bucket, int(end // resolution) + 1)
+            if rollup.holds(bucket)
+        ]
@@ -0,0 +1,122 @@
+"""
+Always-on counters and a latency histogram for the serial link to the ECM.
+
+The numbers live in shared memory so that the process started by Ecm.begin_poll() can update them
+while the main process reads them. Recording a frame costs a couple of float additions and a log().
+"""
+import math
+import time
+from multiprocessing import RawArray
+from typing import Dict, Iterable
+
+from drivers.exceptions import FailedChecksum, NakResponse, NoResponse, UnknownResponse
+
+ERROR_COUNTERS = {
+    FailedChecksum: 'failed_checksum',
+    NakResponse: 'nak_response',
+    UnknownResponse: 'unknown_response',
+    NoResponse: 'no_response',
+}
+COUNTERS = ('start_time', 'requests', 'frames', 'bytes_sent', 'bytes_received',
+            'latency_sum', 'latency_min', 'latency_max') + tuple(ERROR_COUNTERS.values()) + \
+           ('serial_errors', 'reconnects')
+COUNTER_INDEX = {name: idx for idx, name in enumerate(COUNTERS)}
+_START, _REQUESTS, _FRAMES, _SENT, _RECEIVED, _LATENCY_SUM, _LATENCY_MIN, _LATENCY_MAX = range(8)
+
+# Latency buckets grow by 10% from 0.1 ms so any percentile is accurate to within 10%. Anything past 10 s shares a bucket.
+LATENCY_BASE = 1e-4
+LATENCY_GROWTH = 1.1
+NUM_BUCKETS = math.ceil(math.log(10 / LATENCY_BASE, LATENCY_GROWTH)) + 1
+
+
+class LinkStats:
+    """Counts requests, frames, errors and bytes on the wire and keeps a histogram of request to response latency"""
+
+    def __init__(self):
+        self._counters = RawArray('d', len(COUNTERS))
+        self._buckets = RawArray('d', NUM_BUCKETS)
+        self.reset()
+
+    def reset(self):
+        for idx in range(len(self._counters)):
+            self._counters[idx] = 0
+        for idx in range(NUM_BUCKETS):
+            self._buckets[idx] = 0
+
+        self._counters[_START] = time.monotonic()
+        self._counters[_LATENCY_MIN] = math.inf
+
+    def record_frame(self, latency: float, bytes_sent: int, bytes_received: int):
+        """
+        :param latency: seconds from writing the request to receiving the whole response
+        :param bytes_sent: the size of the request
+        :param bytes_received: everything read while waiting for the response, including garbage
+        """
+        counters = self._counters
+        counters[_REQUESTS] += 1
+        counters[_FRAMES] += 1
+        counters[_SENT] += bytes_sent
+        counters[_RECEIVED] += bytes_received
+        counters[_LATENCY_SUM] += latency
+        if latency < counters[_LATENCY_MIN]:
+            counters[_LATENCY_MIN] = latency
+        if latency > counters[_LATENCY_MAX]:
+            counters[_LATENCY_MAX] = latency
+
+        bucket = 0 if latency <= LATENCY_BASE else int(math.log(latency / LATENCY_BASE, LATENCY_GROWTH)) + 1
+        self._buckets[min(bucket, NUM_BUCKETS - 1)] += 1
+
+    def record_error(self, error: Exception, bytes_sent: int, bytes_received: int):
+        """Counts a request which failed with one of the exceptions in ERROR_COUNTERS"""
+        counters = self._counters
+        counters[_REQUESTS] += 1
+        counters[_SENT] += bytes_sent
+        counters[_RECEIVED] += bytes_received
+        counters[COUNTER_INDEX[ERROR_COUNTERS[type(error)]]] += 1
+
+    def count(self, name: str):
+        """Adds one to a counter which isn't about a single request, e.g. reconnects"""
+        self._counters[COUNTER_INDEX[name]] += 1
+
+    @property
+    def counters(self) -> Dict[str, float]:
+        return dict(zip(COUNTERS, self._counters))
+
+    def latency_percentile(self, percentile: float) -> float:
+        """
+        :param percentile: between 0 and 100
+        :return: the latency in seconds which that percentage of frames were received within, or NaN if there were none
+        """
+        buckets = list(self._buckets)
+        total = sum(buckets)
+        if not total:
+            return math.nan
+
+        wanted = total * percentile / 100
+        seen = 0
+        for bucket, count in enumerate(buckets):
+            seen += count
+            if count and seen >= wanted:
+                upper = LATENCY_BASE * LATENCY_GROWTH ** bucket
+                return min(upper, self._counters[_LATENCY_MAX])
+
+        return self._counters[_LATENCY_MAX]
+
+    def summary(self, percentiles: Iterable[float] = (50, 90, 99, 99.9)) -> dict:
+        """:return: the counters plus rates and latency percentiles, all as plain numbers"""
+        summary = self.counters
+        elapsed = time.monotonic() - summary.pop('start_time')
+        requests = summary['requests']
+        frames = summary['frames']
+
+        summary['elapsed'] = elapsed
+        summary['frames_per_second'] = frames / elapsed if elapsed > 0 else 0.0
+        summary['bytes_per_second'] = (summary['bytes_sent'] + summary['bytes_received']) / elapsed if elapsed > 0 else 0.0
+        for name in ERROR_COUNTERS.values():
+            summary[f'{name}_rate'] = summary[name] / requests if requests else 0.0
+
+        summary['latency_mean'] = summary['latency_sum'] / frames if frames else math.nan
+        if not frames:
+            summary['latency_min'] = math.nan
+        summary['latency_percentiles'] = {percentile: self.latency_percentile(percentile) for percentile in percentiles}
+        return summary
@@ -0,0 +1,131 @@
+"""
+Loads the live data dictionary (drivers/live_data.json), checks it for mistakes
+and caches the checked result so that later start-ups can skip parsing and checking it.
+"""
+import hashlib
+import json
+import marshal
+import os
+import sys
+import warnings
+from typing import List, Tuple
+
+from drivers.exceptions import SchemaError
+
+LIVE_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'live_data.json')
+FRAME_LENGTH = 126  # the number of bytes of live data the ECM sends
+CACHE_VERSION = 1
+
+REQUIRED_KEYS = {
+    'scalar': ('addresses', 'signed', 'endianness', 'scale_factor', 'offset', 'units', 'format_string'),
+    'bitfield': ('addresses', 'bits'),
+}
+
+
+def validate(live_data_dict: dict, frame_length: int = FRAME_LENGTH) -> Tuple[List[str], List[str]]:
+    """
+    :param live_data_dict: a dictionary containing info about all the available live data like location and format
+    :param frame_length: the length of the live data buffer that the addresses point into
+    :return: a list of errors which would make the parameter decode wrongly
+        and a list of warnings about things which look suspicious but might be intended
+    """
+    errors = []
+    problems = []
+    spans = {}
+
+    for name, param_info in live_data_dict.items():
+        param_type = param_info.get('type')
+        if param_type not in REQUIRED_KEYS:
+            errors.append(f'{name}: unknown type {param_type!r}')
+            continue
+
+        missing = [key for key in REQUIRED_KEYS[param_type] if key not in param_info]
+        if missing:
+            errors.append(f'{name}: missing {", ".join(missing)}')
+            continue
+
+        if not param_info['addresses']:
+            errors.append(f'{name}: has no addresses')
+            continue
+
+        num_bytes = 0
+        for location in param_info['addresses']:
+            if location['num_bytes'] < 1 or location['offset'] < 0:
+                errors.append(f'{name}: bad address {location}')
+            elif location['offset'] + location['num_bytes'] > frame_length:
+                errors.append(f'{name}: bytes {location["offset"]} to {location["offset"] + location["num_bytes"] - 1} '
+                              f'are past the end of the {frame_length} byte frame')
+            num_bytes += location['num_bytes']
+
+        if param_type == 'scalar':
+            if param_info['endianness'] not in ('little', 'big'):
+                errors.append(f'{name}: bad endianness {param_info["endianness"]!r}')
+        elif len(param_info['bits']) > num_bytes * 8:
+            problems.append(f'{name}: describes {len(param_info["bits"])} bits but only has {num_bytes} bytes')
+
+        spans[name] = tuple((location['offset'], location['num_bytes']) for location in param_info['addresses'])
+
+    # Parameters at exactly the same address are deliberate aliases. Partial overlaps are more likely to be mistakes.
+    owners = {}
+    for name, span in spans.items():
+        for offset, num_bytes in span:
+            for byte_idx in range(offset, offset + num_bytes):
+                owners.setdefault(byte_idx, []).append(name)
+
+    overlaps = set()
+    for names in owners.values():
+        for idx, first in enumerate(names):
+            for second in names[idx + 1:]:
+                if spans[first] != spans[second]:
+                    overlaps.add((first, second))
+
+    problems += [f'{first} partly overlaps {second}' for first, second in sorted(overlaps)]
+    return errors, problems
+
+
+def _cache_path(json_path: str) -> str:
+    json_dir, json_name = os.path.split(json_path)
+    return os.path.join(json_dir, '__pycache__', f'{json_name}.{sys.implementation.cache_tag}.cache')
+
+
+def load_live_data_dict(json_path: str = LIVE_DATA_PATH, frame_length: int = FRAME_LENGTH) -> dict:
+    """
+    Loads the live data dictionary. The first time a version of the JSON is loaded it is checked with validate()
+    and the result is cached so that later loads only have to hash the file.
+
+    :param json_path: where the live data dictionary is
+    :param frame_length: the length of the live data buffer that the addresses point into
+    :raises SchemaError: if the dictionary has errors
+    :return: a dictionary containing info about all the available live data like location and format
+    """
+    with open(json_path, 'rb') as json_file:
+        raw = json_file.read()
+
+    key = (CACHE_VERSION, hashlib.sha256(raw).hexdigest(), frame_length)
+    cache_path = _cache_path(json_path)
+
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cached_key, live_data_dict = marshal.loads(cache_file.read())
+        if cached_key == key:
+            return live_data_dict
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    live_data_dict = json.loads(raw)
+    errors, problems = validate(live_data_dict, frame_length)
+    if errors:
+        raise SchemaError(f'{json_path} has errors:\n' + '\n'.join(errors))
+    for problem in problems:
+        warnings.warn(f'{json_path}: {problem}')
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f'{cache_path}.{os.getpid()}'
+        with open(temp_path, 'wb') as cache_file:
+            marshal.dump((key, live_data_dict), cache_file)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass  # e.g. a read-only file system. We'll just validate again next time.
+
+    return live_data_dict
@@ -0,0 +1,228 @@
+"""
+A compact binary log of raw live data frames.
+
+The file starts with FILE_HEADER and is followed by one record per frame. Each record is RECORD followed by its payload.
+Key records hold the whole frame. Delta records hold (offset, XOR) byte pairs against the previous frame,
+which keeps the mostly static live data small on disk. Every keyframe_interval frames a key record is written
+so that a reader can start decoding from there. When the recorder is closed an index of the key records is appended
+so the reader doesn't have to scan the file to find them.
+"""
+import mmap
+from bisect import bisect_right
+from struct import Struct
+from typing import Iterator, List
+
+from drivers.frame_ring import Frame
+
+MAGIC = b'ROOIBOS\x00'
+INDEX_MAGIC = b'RBINDEX\x00'
+VERSION = 1
+
+FILE_HEADER = Struct('<8sH')  # magic, version
+RECORD = Struct('<dBH')  # timestamp, kind, payload length
+INDEX_ENTRY = Struct('<dQQ')  # timestamp, file offset, frame number
+FOOTER = Struct('<QQ8s')  # file offset of the index, number of index entries, magic
+
+KEY = 0
+DELTA = 1
+
+
+class FrameRecorder:
+    """Appends raw frames and their timestamps to a binary log file"""
+
+    def __init__(self, path: str, delta=True, keyframe_interval=64):
+        """
+        :param path: where to write the log. An existing file is overwritten.
+        :param delta: If set to true, frames are stored as XOR deltas against the previous frame where it saves space
+        :param keyframe_interval: how many frames may go by between key records. Smaller means faster seeks.
+        """
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.frame_count = 0
+
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._previous = None
+        self._since_keyframe = 0
+        self._index: List[bytes] = []
+
+    def write(self, frame: bytes, timestamp: float):
+        """
+        :param frame: the raw live data buffer
+        :param timestamp: the time.monotonic() time at which the frame was received
+        """
+        payload = None
+        if self.delta and self._since_keyframe < self.keyframe_interval and self._previous is not None \
+                and len(frame) == len(self._previous) and len(frame) <= 256:
+            changes = bytearray()
+            for offset, (old, new) in enumerate(zip(self._previous, frame)):
+                if old != new:
+                    changes += bytes((offset, old ^ new))
+
+            if len(changes) < len(frame):
+                payload = changes
+
+        if payload is None:
+            self._file.flush()
+            self._index.append(INDEX_ENTRY.pack(timestamp, self._file.tell(), self.frame_count))
+            self._file.write(RECORD.pack(timestamp, KEY, len(frame)) + frame)
+            self._since_keyframe = 1
+        else:
+            self._file.write(RECORD.pack(timestamp, DELTA, len(payload)) + payload)
+            self._since_keyframe += 1
+
+        self._previous = frame
+        self.frame_count += 1
+
+    def close(self):
+        """Writes the keyframe index and closes the file"""
+        if self._file.closed:
+            return
+
+        index_offset = self._file.tell()
+        self._file.write(b''.join(self._index))
+        self._file.write(FOOTER.pack(index_offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FrameLog:
+    """
+    Reads a log written by FrameRecorder.
+    The file is memory mapped and frames are decoded as they are iterated over so a whole ride never has to fit in memory.
+    """
+
+    def __init__(self, path: str):
+        """:param path: the log to read"""
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = FILE_HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} frame log')
+
+        self._key_times: List[float] = []
+        self._key_offsets: List[int] = []
+        self._key_numbers: List[int] = []
+
+        if not self._read_index():
+            self._scan_index()
+
+    def _read_index(self) -> bool:
+        """Loads the index written when the recorder was closed. Returns False if there isn't one."""
+        if len(self._map) < FILE_HEADER.size + FOOTER.size:
+            return False
+
+        index_offset, num_entries, magic = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        if magic != INDEX_MAGIC:
+            return False
+
+        for entry_offset in range(index_offset, index_offset + num_entries * INDEX_ENTRY.size, INDEX_ENTRY.size):
+            timestamp, offset, number = INDEX_ENTRY.unpack_from(self._map, entry_offset)
+            self._key_times.append(timestamp)
+            self._key_offsets.append(offset)
+            self._key_numbers.append(number)
+
+        self._end = index_offset
+        self.frame_count = self._count_frames(self._key_offsets[-1], self._key_numbers[-1]) if num_entries else 0
+        return True
+
+    def _scan_index(self):
+        """Finds the key records of a log which wasn't closed properly, e.g. because the power was cut"""
+        self._end = len(self._map)
+        self.frame_count = self._count_frames(FILE_HEADER.size, 0, build_index=True)
+
+    def _count_frames(self, offset: int, number: int, build_index=False) -> int:
+        """Hops over record headers from offset until the end of the records and returns the number of frames"""
+        while offset + RECORD.size <= self._end:
+            timestamp, kind, length = RECORD.unpack_from(self._map, offset)
+            if offset + RECORD.size + length > self._end:
+                break  # a record that was cut off part way through
+
+            if build_index and kind == KEY:
+                self._key_times.append(timestamp)
+                self._key_offsets.append(offset)
+                self._key_numbers.append(number)
+
+            offset += RECORD.size + length
+            number += 1
+
+        self._end = offset
+        return number
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def __iter__(self) -> Iterator[Frame]:
+        return self.frames()
+
+    @property
+    def start_time(self) -> float:
+        return self._key_times[0] if self._key_times else None
+
+    def chunk_times(self, frames_per_chunk: int) -> List[float]:
+        """
+        Splits the log into chunks which can be read independently, e.g. by different processes.
+        Each chunk starts at a keyframe so it can be read with frames(start_time, end_time) from one start time to the next.
+
+        :param frames_per_chunk: roughly how many frames to put in each chunk. Rounded up to a whole number of keyframes.
+        :return: the start time of each chunk
+        """
+        times = []
+        next_number = 0
+        for key_time, number in zip(self._key_times, self._key_numbers):
+            if number >= next_number:
+                times.append(key_time)
+                next_number = number + frames_per_chunk
+
+        return times
+
+    def frames(self, start_time: float = None, end_time: float = None) -> Iterator[Frame]:
+        """
+        :param start_time: skip frames recorded before this time. Finding the start is a binary search over keyframes.
+        :param end_time: stop before the first frame recorded at or after this time
+        :return: an iterator of frames in the order they were recorded. The seq of each frame is its number in the log.
+        """
+        if not self._key_offsets:
+            return
+
+        key_idx = 0
+        if start_time is not None:
+            key_idx = max(0, bisect_right(self._key_times, start_time) - 1)
+
+        offset = self._key_offsets[key_idx]
+        number = self._key_numbers[key_idx]
+        current = bytearray()
+
+        while offset < self._end:
+            timestamp, kind, length = RECORD.unpack_from(self._map, offset)
+            payload_offset = offset + RECORD.size
+            if end_time is not None and timestamp >= end_time:
+                return
+
+            if kind == KEY:
+                current[:] = self._map[payload_offset: payload_offset + length]
+            else:
+                for pair_offset in range(payload_offset, payload_offset + length, 2):
+                    current[self._map[pair_offset]] ^= self._map[pair_offset + 1]
+
+            if start_time is None or timestamp >= start_time:
+                yield Frame(number, timestamp, bytes(current))
+
+            offset = payload_offset + length
+            number += 1
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
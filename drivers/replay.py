@@ -0,0 +1,199 @@
+"""
+Stands in for the ECM by answering live data requests on a pseudo-terminal with recorded frames.
+Point Ecm(serial_port=replay.port) at it to run everything without the bike.
+"""
+import os
+import random
+import select
+import time
+import tty
+from argparse import ArgumentParser
+from threading import Event, Thread
+from typing import Iterable, Iterator, Optional
+
+from drivers.frame_ring import Frame
+from drivers.serial_protocol import LIVE_DATA_REQUEST, construct_response
+
+
+class EcmReplay:
+    """
+    Serves a stream of recorded frames through a local pty using the same request/response protocol as the ECM.
+    Latency and transmission errors can be injected to exercise the recovery paths of the driver.
+    """
+
+    def __init__(self, frames: Iterable[Frame], speed: Optional[float] = 1.0, loop=True,
+                 latency=0.0, jitter=0.0, corrupt_rate=0.0, checksum_error_rate=0.0, drop_rate=0.0, seed=None):
+        """
+        :param frames: the frames to serve, e.g. a FrameLog. Must be iterable more than once if loop is set.
+        :param speed: how fast recorded time passes compared to real time. 1 is real time.
+            None serves the next frame on every request no matter how quickly the requests come in.
+        :param loop: If set to true, the frames start over once they run out. Otherwise requests go unanswered.
+        :param latency: seconds to wait before responding to a request
+        :param jitter: up to this many extra seconds are randomly added to the latency
+        :param corrupt_rate: the fraction of responses which get a bit flipped somewhere in their body
+        :param checksum_error_rate: the fraction of responses which get a wrong checksum byte
+        :param drop_rate: the fraction of requests which get no response at all
+        :param seed: seeds the random number generator used for jitter and errors so runs can be reproduced
+        """
+        self.frames = frames
+        self.speed = speed
+        self.loop = loop
+        self.latency = latency
+        self.jitter = jitter
+        self.corrupt_rate = corrupt_rate
+        self.checksum_error_rate = checksum_error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+
+        self.requests_served = 0
+        self.bytes_sent = 0
+
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+        self.port = os.ttyname(self._slave_fd)
+
+        self._stop = Event()
+        self._thread = None
+        self._started = False
+        self._frame_iter: Iterator[Frame] = iter(())
+        self._current: Optional[Frame] = None
+        self._upcoming: Optional[Frame] = None
+        self._start_time = None
+        self._first_timestamp = None
+
+    def start(self):
+        """Starts answering requests in a background thread"""
+        self._stop.clear()
+        self._thread = Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        os.close(self._master_fd)
+        os.close(self._slave_fd)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _restart(self) -> bool:
+        """Goes back to the first frame. Returns False if there are no frames to serve."""
+        if self._started and not self.loop:
+            return False
+
+        self._started = True
+        self._frame_iter = iter(self.frames)
+        self._current = next(self._frame_iter, None)
+        self._upcoming = next(self._frame_iter, None)
+        self._start_time = time.monotonic()
+        if self._current is None:
+            return False
+
+        self._first_timestamp = self._current.timestamp
+        return True
+
+    def _next_frame(self) -> Optional[Frame]:
+        """:return: the frame the ECM would be reporting right now or None if the recording has ended"""
+        if self._current is None and not self._restart():
+            return None
+
+        if self.speed is None:
+            frame = self._current
+            self._current = self._upcoming
+            self._upcoming = next(self._frame_iter, None)
+            return frame
+
+        replay_time = self._first_timestamp + (time.monotonic() - self._start_time) * self.speed
+
+        while self._upcoming is not None and self._upcoming.timestamp <= replay_time:
+            self._current = self._upcoming
+            self._upcoming = next(self._frame_iter, None)
+
+        if self._upcoming is None and self._current.timestamp < replay_time:
+            # the recording has run out
+            self._current = None
+            if not self._restart():
+                return None
+
+        return self._current
+
+    def _respond(self):
+        if self.random.random() < self.drop_rate:
+            return
+
+        frame = self._next_frame()
+        if frame is None:
+            return
+
+        response = bytearray(construct_response(frame.data))
+        if self.random.random() < self.corrupt_rate:
+            response[self.random.randrange(7, len(response) - 2)] ^= 1 << self.random.randrange(8)
+        if self.random.random() < self.checksum_error_rate:
+            response[-1] ^= 0xFF
+
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        view = memoryview(response)
+        while view:
+            view = view[os.write(self._master_fd, view):]
+
+        self.requests_served += 1
+        self.bytes_sent += len(response)
+
+    def _serve(self):
+        pending = bytearray()
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master_fd], [], [], 0.05)
+            if not readable:
+                continue
+
+            pending += os.read(self._master_fd, 4096)
+            while True:
+                idx = pending.find(LIVE_DATA_REQUEST)
+                if idx < 0:
+                    # keep the tail in case a request has only partly arrived
+                    del pending[:max(0, len(pending) - len(LIVE_DATA_REQUEST) + 1)]
+                    break
+
+                del pending[:idx + len(LIVE_DATA_REQUEST)]
+                self._respond()
+
+
+if __name__ == '__main__':
+    from drivers.ecm import LIVE_DATA_SAMPLE
+    from drivers.recorder import FrameLog
+
+    parser = ArgumentParser(description='Pretends to be the ECM on a pseudo-terminal')
+    parser.add_argument('log', nargs='?', help='a FrameRecorder log to replay. Defaults to the mock data sample')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed. 0 means as fast as requested')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds before each response')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='fraction of responses with a flipped bit')
+    parser.add_argument('--bad-checksum', type=float, default=0.0, help='fraction of responses with a bad checksum')
+    parser.add_argument('--drop', type=float, default=0.0, help='fraction of requests which are ignored')
+    args = parser.parse_args()
+
+    source = FrameLog(args.log) if args.log else [Frame(0, 0.0, LIVE_DATA_SAMPLE)]
+    replay = EcmReplay(
+        source, speed=args.speed or None, latency=args.latency, jitter=args.jitter,
+        corrupt_rate=args.corrupt, checksum_error_rate=args.bad_checksum, drop_rate=args.drop
+    )
+
+    with replay:
+        print(f'Serving on {replay.port}. Press Ctrl+C to stop.')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print(f'Served {replay.requests_served} requests')
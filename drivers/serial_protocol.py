@@ -0,0 +1,162 @@
+"""
+Framing for the serial protocol spoken by the ECM.
+
+Every message looks like this:
+
+    SOH | sender | receiver | size | EOH | SOT | body... | EOT | checksum
+
+where size is the length of the body plus one for the EOT byte and the checksum is the XOR of every byte
+between SOH and the checksum itself. Responses from the ECM start their body with an ACK or NAK byte.
+"""
+from functools import lru_cache, reduce
+from operator import xor
+from typing import Optional
+
+from drivers.exceptions import FailedChecksum, NakResponse, NoResponse, UnknownResponse
+
+SOH = 0x01
+EOH = 0xFF
+SOT = 0x02
+EOT = 0x03
+ACK = 0x06
+NAK = 0x15
+
+PC_ID = 0x00
+ECM_ID = 0x42
+
+HEADER_LENGTH = 6
+
+
+def checksum(data) -> int:
+    """:return: the XOR of all the bytes in data"""
+    return reduce(xor, data, 0)
+
+
+def frame_message(body: bytes, sender: int, receiver: int) -> bytes:
+    """Wraps the body in the header, trailer and checksum"""
+    message = bytes([SOH, sender, receiver, len(body) + 1, EOH, SOT]) + body + bytes([EOT])
+    return message + bytes([checksum(message[1:])])
+
+
+@lru_cache()
+def construct_message(body: bytes) -> bytes:
+    """
+    Wraps the body in the header, trailer and checksum needed to send it to the ECM.
+    Messages are cached since the same few requests are sent over and over.
+
+    :param body: the command and any arguments, e.g. b'C' to request live data
+    :return: the full message ready to be written to the serial port
+    """
+    return frame_message(body, PC_ID, ECM_ID)
+
+
+def construct_response(body: bytes, status: int = ACK) -> bytes:
+    """
+    Builds a message the way the ECM would send it. Useful for standing in for the ECM.
+
+    :param body: the data being returned, e.g. a live data frame
+    :param status: ACK or NAK
+    :return: the full message as it would be read from the serial port
+    """
+    return frame_message(bytes([status]) + body, ECM_ID, PC_ID)
+
+
+LIVE_DATA_REQUEST = construct_message(b'C')
+
+
+class MessageReader:
+    """
+    Incrementally parses messages from the ECM out of a reusable buffer.
+
+    Bytes which can't be the start of a message are skipped, so after a corrupted message the reader picks up at the
+    next valid header instead of waiting for the serial timeout to expire.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.bytes_read = 0  # everything fed in so far, including garbage
+
+    def reset(self):
+        """Throws away any partially received data"""
+        self.buffer.clear()
+
+    def feed(self, data: bytes):
+        self.bytes_read += len(data)
+        self.buffer += data
+
+    def bytes_needed(self) -> int:
+        """:return: the minimum number of bytes which must be fed in before another message could be complete"""
+        buf = self.buffer
+        if len(buf) < HEADER_LENGTH or buf[0] != SOH:
+            return max(1, HEADER_LENGTH - len(buf))
+
+        return max(1, HEADER_LENGTH + buf[3] + 1 - len(buf))
+
+    def next_message(self) -> Optional[bytes]:
+        """
+        :return: the body of the next complete message in the buffer with the ACK byte removed
+            or None if no complete message has been received yet
+        :raises FailedChecksum: if a message was received but it was corrupted.
+            The reader resynchronizes on the byte after the bad message's SOH.
+        :raises NakResponse: if the ECM responded with a NAK
+        :raises UnknownResponse: if the ECM responded with neither an ACK nor a NAK
+        """
+        buf = self.buffer
+        while True:
+            start = buf.find(SOH)
+            if start < 0:
+                buf.clear()
+                return None
+
+            if start:
+                del buf[:start]
+
+            if len(buf) < HEADER_LENGTH:
+                return None
+
+            sender, receiver, size, eoh, sot = buf[1:HEADER_LENGTH]
+            if sender != ECM_ID or receiver != PC_ID or eoh != EOH or sot != SOT or size < 2:
+                del buf[:1]
+                continue
+
+            message_length = HEADER_LENGTH + size + 1
+            if len(buf) < message_length:
+                return None
+
+            with memoryview(buf) as view:
+                valid = buf[message_length - 2] == EOT and checksum(view[1:message_length - 1]) == buf[message_length - 1]
+
+            if not valid:
+                del buf[:1]
+                raise FailedChecksum()
+
+            status = buf[HEADER_LENGTH]
+            body = bytes(buf[HEADER_LENGTH + 1: message_length - 2])
+            del buf[:message_length]
+
+            if status == ACK:
+                return body
+            elif status == NAK:
+                raise NakResponse()
+            else:
+                raise UnknownResponse(f'Unexpected status byte {status:#04x}')
+
+    def receive(self, conn) -> bytes:
+        """
+        Reads from the connection until a full message has been received.
+        Everything already waiting on the port is read in one go and only the bytes still missing are waited for.
+
+        :param conn: an open serial.Serial connection. Its timeout applies to each read.
+        :return: the body of the message with the ACK byte removed
+        :raises NoResponse: if the connection timed out before a full message arrived
+        """
+        while True:
+            message = self.next_message()
+            if message is not None:
+                return message
+
+            data = conn.read(max(conn.in_waiting, self.bytes_needed()))
+            if not data:
+                raise NoResponse()
+
+            self.feed(data)
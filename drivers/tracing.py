@@ -0,0 +1,136 @@
+"""
+Optional tracing of where the time goes between the ECM sampling a value and it showing up on the display.
+
+Wrap a stage in `with tracing.span('name', seq=...):` or record one after the fact with tracing.complete().
+Until start_tracing() is called these do nothing but check a global, so they can stay in the hot paths.
+
+Traces are written in the Chrome trace event format (https://ui.perfetto.dev or chrome://tracing can open them).
+Every process appends whole lines to the same file, so spans from the polling process started by Ecm.begin_poll()
+end up in the trace as long as tracing was started before it.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+FLUSH_EVENTS = 1000  # events buffered in memory before they're written to the file
+
+_fd = None
+_events = []
+
+NULL_SPAN = nullcontext()
+
+
+def is_enabled() -> bool:
+    return _fd is not None
+
+
+def _microseconds(timestamp: float) -> float:
+    return timestamp * 1e6
+
+
+def _add(event: dict):
+    event['pid'] = os.getpid()
+    event['tid'] = threading.get_native_id()
+    _events.append(event)
+    if len(_events) >= FLUSH_EVENTS:
+        flush()
+
+
+class Span:
+    """Records a complete event covering the time spent inside the with block"""
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        complete(self.name, self.start, **self.args)
+
+
+def span(name: str, **args):
+    """
+    :param name: the stage being timed
+    :param args: anything worth seeing alongside the span, e.g. the frame's sequence number
+    :return: a context manager which times the with block it is used in
+    """
+    if _fd is None:
+        return NULL_SPAN
+
+    return Span(name, args)
+
+
+def complete(name: str, start: float, end: float = None, **args):
+    """
+    Records a span which has already happened
+
+    :param start: the time.monotonic() time at which it started, e.g. the timestamp of a frame
+    :param end: the time.monotonic() time at which it ended. Defaults to now.
+    """
+    if _fd is None:
+        return
+
+    if end is None:
+        end = time.monotonic()
+    _add({'name': name, 'ph': 'X', 'ts': _microseconds(start), 'dur': _microseconds(end - start), 'args': args})
+
+
+def name_process(name: str):
+    """Labels the current process in the trace, e.g. 'ecm poll'"""
+    if _fd is not None:
+        _add({'name': 'process_name', 'ph': 'M', 'args': {'name': name}})
+
+
+def flush():
+    """Writes out the buffered events. Processes other than the one which started tracing must call this before exiting."""
+    global _events
+    if _fd is None or not _events:
+        return
+
+    data = ''.join(json.dumps(event) + ',\n' for event in _events).encode()
+    _events = []
+    os.write(_fd, data)
+
+
+def start_tracing(path: str, process_name='main'):
+    """
+    :param path: the trace file to write. It is overwritten.
+    :param process_name: what to label the current process as in the trace
+    """
+    global _fd
+    stop_tracing()
+
+    # O_APPEND makes each flush land at the end of the file even when several processes are writing to it
+    _fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+    os.write(_fd, b'[\n')
+    name_process(process_name)
+
+
+def stop_tracing():
+    """Writes out everything and closes the trace file. Any polling process should have been ended first."""
+    global _fd
+    if _fd is None:
+        return
+
+    flush()
+    # the trailing comma after the last event needs something after it to be valid JSON
+    os.write(_fd, json.dumps({'name': 'trace_end', 'ph': 'i', 's': 'g', 'ts': _microseconds(time.monotonic()),
+                              'pid': os.getpid(), 'tid': threading.get_native_id()}).encode() + b'\n]\n')
+    os.close(_fd)
+    _fd = None
+
+
+def _forget_parent_events():
+    global _events
+    _events = []
+
+
+# a forked process would otherwise write out the events its parent had buffered a second time
+os.register_at_fork(after_in_child=_forget_parent_events)
@@ -1,9 +1,14 @@
-import json
 import curses
 import time
+from argparse import ArgumentParser
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional
 
+from drivers.broker import LiveDataSubscriber
 from drivers.ecm import Ecm
+from drivers.live_data_schema import load_live_data_dict
 
+# shown first and with friendlier names. Everything else in the live data dictionary comes after them.
 PARAMETERS = {
     'engine_rpm': 'RPM',
     'throttle_position': 'Throttle',
@@ -13,34 +18,198 @@ PARAMETERS = {
     'air_temperature': 'Air Temp'
 }
 
+VALUE_WIDTH = 16  # the least room left for values when labels are long
+STALE_AFTER = 0.5  # seconds without a new frame before the status line turns red
 
-def display_live_data(stdscr):
-    curses.init_pair(1, curses.COLOR_YELLOW, curses.COLOR_BLUE)
-    stdscr.clear()
 
-    while True:
-        for idx, param_name in enumerate(PARAMETERS):
-            display_name = PARAMETERS[param_name]
-            format_str = '{:' + live_data_dict[param_name]['format_string'] + '}'
-            units = live_data_dict[param_name]['units']
+class Row(NamedTuple):
+    label: str
+    name: str
+    bit: Optional[str]  # the bit of a bitfield this row shows or None for scalars
+    format: Callable[[object], str]
 
-            param_value = ecm.live_data[param_name]
-            param_value = format_str.format(param_value)
 
-            stdscr.addstr(idx, 0, f'{display_name}: {param_value} {units}', curses.color_pair(1))
+def build_rows(live_data_dict: dict) -> List[Row]:
+    """:return: a row for every scalar and every bit of every bitfield with its formatter compiled up front"""
+    rows = []
+    names = list(PARAMETERS) + [name for name in live_data_dict if name not in PARAMETERS]
+    for name in names:
+        param_info = live_data_dict[name]
+        label = PARAMETERS.get(name, name)
 
-        stdscr.refresh()
-        time.sleep(0.03)
+        if param_info['type'] == 'scalar':
+            units = param_info['units'].replace('{', '{{').replace('}', '}}')
+            template = '{:' + param_info['format_string'] + '} ' + units
+            rows.append(Row(label, name, None, template.format))
+        else:
+            for bit in dict.fromkeys(param_info['bits']):
+                rows.append(Row(f'{label}: {bit}', name, bit, lambda value: 'on' if value else 'off'))
+
+    return rows
+
+
+class LiveDataViewer:
+    """
+    Shows a page of live data rows and only redraws the cells whose text changed.
+    Each refresh reads one snapshot and only the parameters on the current page are decoded.
+
+    Keys: page down/space for the next page, page up/b for the previous one, / to filter by name, q to quit.
+    """
+
+    def __init__(self, stdscr, ecm, rows: List[Row], refresh_period=0.1):
+        """
+        :param ecm: an Ecm which is polling or a LiveDataSubscriber
+        :param refresh_period: seconds between refreshes
+        """
+        self.stdscr = stdscr
+        self.ecm = ecm
+        self.rows = rows
+        self.refresh_period = refresh_period
+
+        self.filter = ''
+        self.page = 0
+        self._matching_rows = rows
+        self._page_rows: List[Row] = []
+        self._drawn: Dict[int, str] = {}  # screen line -> value text currently on it
+        self._label_width = 0
+        self._last_seq = None
+        self._seq_history = deque()  # (time, seq) over the last second or so for the frame rate
+
+    @property
+    def page_size(self) -> int:
+        return max(1, self.stdscr.getmaxyx()[0] - 1)  # the bottom line is the status line
+
+    @property
+    def num_pages(self) -> int:
+        return max(1, -(-len(self._matching_rows) // self.page_size))
+
+    def run(self):
+        curses.curs_set(0)
+        curses.init_pair(1, curses.COLOR_YELLOW, curses.COLOR_BLUE)
+        curses.init_pair(2, curses.COLOR_WHITE, curses.COLOR_RED)
+        self.stdscr.timeout(round(self.refresh_period * 1000))
+        self._redraw_page()
+
+        while True:
+            self._refresh()
+            key = self.stdscr.getch()  # doubles as the wait between refreshes
+            if key in (ord('q'), ord('Q')):
+                return
+            elif key in (curses.KEY_NPAGE, ord(' ')):
+                self._change_page(1)
+            elif key in (curses.KEY_PPAGE, ord('b')):
+                self._change_page(-1)
+            elif key == ord('/'):
+                self._read_filter()
+            elif key == curses.KEY_RESIZE:
+                self._redraw_page()
+
+    def _change_page(self, step: int):
+        self.page = (self.page + step) % self.num_pages
+        self._redraw_page()
+
+    def _read_filter(self):
+        height, width = self.stdscr.getmaxyx()
+        self.stdscr.addnstr(height - 1, 0, '/'.ljust(width - 1), width - 1)
+        self.stdscr.timeout(-1)
+        curses.echo()
+        curses.curs_set(1)
+        try:
+            self.filter = self.stdscr.getstr(height - 1, 1, width - 2).decode(errors='ignore').strip()
+        finally:
+            curses.noecho()
+            curses.curs_set(0)
+            self.stdscr.timeout(round(self.refresh_period * 1000))
+
+        self.page = 0
+        self._redraw_page()
+
+    def _redraw_page(self):
+        """Works out which rows are on the current page and draws their labels. Values get drawn by the next refresh."""
+        text = self.filter.lower()
+        self._matching_rows = [row for row in self.rows if text in row.label.lower() or text in row.name.lower()]
+        self.page = min(self.page, self.num_pages - 1)
+        start = self.page * self.page_size
+        self._page_rows = self._matching_rows[start: start + self.page_size]
+
+        self.stdscr.erase()
+        self._drawn.clear()
+        self._last_seq = None
+
+        width = self.stdscr.getmaxyx()[1]
+        self._label_width = min(max((len(row.label) for row in self._page_rows), default=0) + 2, width - VALUE_WIDTH)
+        for line, row in enumerate(self._page_rows):
+            self.stdscr.addnstr(line, 0, f'{row.label}:', max(0, min(self._label_width - 1, width - 1)))
+
+    def _refresh(self):
+        live_data = self.ecm.live_data
+        now = time.monotonic()
+        width = self.stdscr.getmaxyx()[1]
+        value_width = width - self._label_width - 1
+
+        if live_data is not None and live_data.seq != self._last_seq and value_width > 0:
+            self._last_seq = live_data.seq
+            for line, row in enumerate(self._page_rows):
+                value = live_data[row.name]
+                text = row.format(value if row.bit is None else value[row.bit])
+                if self._drawn.get(line) != text:
+                    self.stdscr.addnstr(line, self._label_width, text.ljust(value_width), value_width,
+                                        curses.color_pair(1))
+                    self._drawn[line] = text
+
+        self._draw_status(live_data, now, width)
+        self.stdscr.refresh()
+
+    def _draw_status(self, live_data, now: float, width: int):
+        history = self._seq_history
+        if live_data is not None:
+            history.append((now, live_data.seq))
+        while len(history) > 2 and now - history[0][0] > 1:
+            history.popleft()
+
+        fps = 0.0
+        if len(history) > 1 and history[-1][0] > history[0][0]:
+            fps = (history[-1][1] - history[0][1]) / (history[-1][0] - history[0][0])
+
+        age = now - live_data.timestamp if live_data is not None and live_data.timestamp is not None else None
+        health = self.ecm.health
+        status = f' {fps:5.1f} fps | ' + (f'{age * 1000:6.0f} ms old' if age is not None else 'no data') + \
+                 (f' | ECM {health}' if health != 'ok' else '') + \
+                 f' | page {self.page + 1}/{self.num_pages}' + (f' | filter: {self.filter}' if self.filter else '') + \
+                 ' | space/b page, / filter, q quit'
+
+        stale = age is None or age > STALE_AFTER
+        self.stdscr.addnstr(self.stdscr.getmaxyx()[0] - 1, 0, status.ljust(width - 1), width - 1,
+                            curses.color_pair(2) if stale else curses.A_REVERSE)
 
 
 if __name__ == '__main__':
-    with open('drivers/live_data.json') as json_file:
-        live_data_dict = json.load(json_file)
+    parser = ArgumentParser(description='Shows the live data from the ECM')
+    parser.add_argument('--port', default='/dev/ttyUSB0', help='the serial port the ECM is on')
+    parser.add_argument('--mock', action='store_true', help='use old ECM data instead of talking to the ECM')
+    parser.add_argument('--subscribe', action='store_true',
+                        help='read the live data from a running broker (python -m drivers.broker) instead of the ECM')
+    parser.add_argument('--refresh', type=float, default=0.1, help='seconds between screen refreshes')
+    parser.add_argument('--filter', default='', help='only show parameters whose name contains this')
+    args = parser.parse_args()
+
+    live_data_dict = load_live_data_dict()
+
+    if args.subscribe:
+        ecm = LiveDataSubscriber(live_data_dict)
+    else:
+        ecm = Ecm(args.port, live_data_dict, mock=args.mock)
+        ecm.begin_poll()
 
-    ecm = Ecm('/dev/ttyUSB0', live_data_dict, mock=True)
-    ecm.begin_poll()
+    def display_live_data(stdscr):
+        viewer = LiveDataViewer(stdscr, ecm, build_rows(live_data_dict), args.refresh)
+        viewer.filter = args.filter
+        viewer.run()
 
     try:
         curses.wrapper(display_live_data)
     finally:
-        ecm.end_poll()
\ No newline at end of file
+        if args.subscribe:
+            ecm.close()
+        else:
+            ecm.end_poll()
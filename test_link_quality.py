@@ -1,33 +1,88 @@
 import json
+import time
+from argparse import ArgumentParser
 
-from drivers.exceptions import FailedChecksum
 from drivers.ecm import Ecm
+from drivers.exceptions import FailedChecksum, NakResponse, NoResponse, UnknownResponse
+from drivers.link_stats import ERROR_COUNTERS
+from drivers.live_data_schema import load_live_data_dict
 
 
-def get_checksum_failure_ratio(ecm: Ecm, num_samples=10):
-    num_failures = 0
-    for sample_num in range(num_samples):
+def soak(ecm: Ecm, duration: float, interval=0.0, report_every=5.0):
+    """
+    Requests live data over and over and prints the link stats every so often
+
+    :param duration: how many seconds to run for
+    :param interval: the time between the start of each request, in seconds. 0 requests as fast as the ECM answers.
+    :param report_every: how many seconds between progress lines
+    """
+    ecm.link_stats.reset()
+    start = time.monotonic()
+    next_request = next_report = start
+
+    while time.monotonic() - start < duration:
         try:
-            ecm.get_live_data_params()
-        except FailedChecksum:
-            num_failures += 1
+            ecm.live_data
+        except (FailedChecksum, NakResponse, UnknownResponse, NoResponse):
+            pass  # counted by ecm.link_stats
+
+        now = time.monotonic()
+        if now >= next_report:
+            print_progress(ecm.link_stats.summary())
+            next_report += report_every
+
+        next_request += interval
+        if next_request > now:
+            time.sleep(next_request - now)
 
-    return num_failures / num_samples
 
+def print_progress(summary: dict):
+    errors = sum(summary[name] for name in ERROR_COUNTERS.values())
+    print(f'{summary["elapsed"]:7.1f} s  {summary["frames_per_second"]:6.1f} fps  '
+          f'p50 {summary["latency_percentiles"][50] * 1000:6.1f} ms  '
+          f'p99 {summary["latency_percentiles"][99] * 1000:6.1f} ms  '
+          f'{errors:.0f} errors in {summary["requests"]:.0f} requests')
 
-def test_quality(ecm: Ecm):
-    while True:
-        failure_ratio = get_checksum_failure_ratio(ecm)
-        print(f'{failure_ratio:.1%}')
+
+def print_report(summary: dict):
+    print()
+    print(f'Requests:        {summary["requests"]:.0f} in {summary["elapsed"]:.1f} s')
+    print(f'Frames:          {summary["frames"]:.0f} ({summary["frames_per_second"]:.1f} per second)')
+    print(f'Bytes:           {summary["bytes_sent"]:.0f} sent, {summary["bytes_received"]:.0f} received '
+          f'({summary["bytes_per_second"]:.0f} per second)')
+    for name in ERROR_COUNTERS.values():
+        print(f'{name + ":":17}{summary[name]:.0f} ({summary[name + "_rate"]:.2%})')
+
+    print(f'Latency:         min {summary["latency_min"] * 1000:.1f} ms, mean {summary["latency_mean"] * 1000:.1f} ms, '
+          f'max {summary["latency_max"] * 1000:.1f} ms')
+    for percentile, latency in summary['latency_percentiles'].items():
+        print(f'    p{percentile:<6} {latency * 1000:8.1f} ms')
 
 
 if __name__ == '__main__':
-    with open('drivers/live_data.json') as json_file:
-        live_data_dict = json.load(json_file)
+    parser = ArgumentParser(description='Hammers the ECM with live data requests and reports on the quality of the link')
+    parser.add_argument('--port', default='/dev/ttyUSB0', help='the serial port the ECM is on')
+    parser.add_argument('--duration', type=float, default=60, help='how many seconds to run for')
+    parser.add_argument('--interval', type=float, default=0,
+                        help='seconds between requests. By default requests are sent as fast as the ECM answers')
+    parser.add_argument('--report-every', type=float, default=5, help='seconds between progress lines')
+    parser.add_argument('--json', action='store_true', help='print the final stats as JSON instead of a table')
+    args = parser.parse_args()
+
+    live_data_dict = load_live_data_dict()
 
-    ecm = Ecm('/dev/ttyUSB0', live_data_dict)
+    ecm = Ecm(args.port, live_data_dict, parameters=[])
     ecm.open_conn()
 
-    test_quality(ecm)
+    try:
+        soak(ecm, args.duration, args.interval, args.report_every)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ecm.close_conn()
 
-    ecm.close_conn()
+    final_summary = ecm.link_stats.summary(percentiles=(50, 90, 95, 99, 99.9, 100))
+    if args.json:
+        print(json.dumps(final_summary, indent=4))
+    else:
+        print_report(final_summary)
@@ -0,0 +1,44 @@
+import pytest
+
+from drivers.derived_channels import DerivedChannels, SavedTotals, default_channels
+
+TANK_GALLONS = 4
+
+
+def ride(derived_channels: DerivedChannels, seconds: int, start=0.0):
+    """Steps the channels through a steady ride at 60 mph and 6000 rpm, one frame a second"""
+    live_data = {'vehicle_speed_mph': 60, 'engine_rpm': 6000, 'fuel_pulse_front': 5, 'fuel_pulse_rear': 5}
+    for second in range(seconds + 1):
+        values = derived_channels.update(live_data, start + second)
+
+    return values
+
+
+def test_fuel_used_survives_a_restart(tmp_path):
+    saved_totals = SavedTotals(str(tmp_path / 'refill.json'))
+    before = ride(DerivedChannels(default_channels(TANK_GALLONS, **saved_totals.load())), 600)
+    saved_totals.save(before)
+
+    after = ride(DerivedChannels(default_channels(TANK_GALLONS, **saved_totals.load())), 0, start=5000)
+    assert after['fuel_used_gallons'] == pytest.approx(before['fuel_used_gallons'])
+    assert after['trip_miles'] == pytest.approx(10)
+    assert after['fuel_remaining_gallons'] == pytest.approx(before['fuel_remaining_gallons'])
+
+
+def test_reset_to_zero_overrides_the_saved_total():
+    derived_channels = DerivedChannels(default_channels(TANK_GALLONS, fuel_used_gallons=3.0, trip_miles=100.0))
+    derived_channels.reset('fuel_used_gallons', initial=0.0)
+    derived_channels.reset('trip_miles', initial=0.0)
+
+    values = ride(derived_channels, 0)
+    assert values['fuel_remaining_gallons'] == TANK_GALLONS
+    derived_channels.reset('fuel_used_gallons')
+    assert ride(derived_channels, 0, start=10)['fuel_used_gallons'] == 0.0
+
+
+def test_nothing_is_saved_before_the_first_frame(tmp_path):
+    saved_totals = SavedTotals(str(tmp_path / 'refill.json'))
+    saved_totals.save({'fuel_used_gallons': 1.5, 'trip_miles': 60.0})
+    saved_totals.save({})
+
+    assert saved_totals.load() == {'fuel_used_gallons': 1.5, 'trip_miles': 60.0}
@@ -0,0 +1,63 @@
+import pytest
+
+from drivers.frame_ring import SEQ, FrameRing
+
+SLOTS = 4
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(slots=SLOTS, frame_capacity=16)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def test_overwritten_slot_reads_as_none(ring):
+    for idx in range(SLOTS + 2):
+        ring.write(bytes([idx]) * 8, timestamp=float(idx))
+
+    assert ring.read(1) is None
+    assert ring.read(2) is None
+    assert ring.read(3).data == bytes([2]) * 8
+    assert ring.read(SLOTS + 2).timestamp == float(SLOTS + 1)
+
+
+def test_slot_being_written_reads_as_none(ring):
+    ring.write(b'old frame', timestamp=1.0)
+    # what another process sees part way through the write which will overwrite slot 1: the start stamp is new
+    # and the end stamp, length and bytes are still those of the old frame
+    SEQ.pack_into(ring.shm.buf, ring._slot_offset(1 + SLOTS), 1 + SLOTS)
+
+    assert ring.read(1) is None
+    assert ring.read(1 + SLOTS) is None
+
+
+def test_since_skips_overwritten_frames_and_leaves_a_gap(ring):
+    for idx in range(10):
+        ring.write(bytes([idx]), timestamp=float(idx))
+
+    assert [frame.seq for frame in ring.since(0)] == [7, 8, 9, 10]
+    assert [frame.seq for frame in ring.since(8)] == [9, 10]
+    assert ring.since(10) == []
+
+
+def test_attached_reader_sees_frames_and_status(ring):
+    reader = FrameRing(ring.name, create=False)
+    try:
+        assert reader.latest() is None
+        assert reader.status == 0
+        ring.write(b'frame', timestamp=5.0)
+        ring.status = 3
+
+        assert (reader.slots, reader.frame_capacity) == (SLOTS, 16)
+        assert reader.latest() == (1, 5.0, b'frame')
+        assert reader.status == 3
+    finally:
+        reader.close()
+
+
+def test_frame_too_big_for_a_slot_is_rejected(ring):
+    with pytest.raises(ValueError):
+        ring.write(bytes(17))
+    assert ring.latest_seq == 0
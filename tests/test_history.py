@@ -0,0 +1,84 @@
+import math
+import random
+
+import pytest
+
+from drivers.history import History
+from drivers.live_data_schema import load_live_data_dict
+
+
+def ride_with_gaps(seed: int, duration: float):
+    """:return: (timestamp, value) samples every 50-500 ms with a few gaps of up to 30 s where nothing was received"""
+    rng = random.Random(seed)
+    samples = []
+    timestamp = 1000.0
+    while timestamp < 1000 + duration:
+        samples.append((timestamp, rng.uniform(0, 8000)))
+        timestamp += rng.uniform(0.05, 30) if rng.random() < 0.02 else rng.uniform(0.05, 0.5)
+
+    return samples
+
+
+def fill(history: History, samples):
+    for timestamp, value in samples:
+        history.add({'engine_rpm': value}, timestamp)
+
+
+def brute_force(samples, first_bucket: int, last_bucket: int):
+    """:return: (min, max, mean, count) of the samples in the 1 s buckets from first_bucket to last_bucket"""
+    values = [value for timestamp, value in samples if first_bucket <= int(timestamp // 1) <= last_bucket]
+    if not values:
+        return math.nan, math.nan, math.nan, 0
+
+    return min(values), max(values), sum(values) / len(values), len(values)
+
+
+def assert_matches(summary, expected):
+    assert summary.count == expected[3]
+    if summary.count:
+        assert summary.min == expected[0]
+        assert summary.max == expected[1]
+        assert summary.mean == pytest.approx(expected[2])
+
+
+def test_gap_in_a_bucket_is_not_counted_twice():
+    history = History(load_live_data_dict(), ['engine_rpm'])
+    fill(history, [(100 + idx / 2, 100 + idx / 2) for idx in range(50) if not 121 <= 100 + idx / 2 < 122])
+
+    summary = history.window('engine_rpm', 10)
+    assert summary.count == 20
+    assert summary.mean == pytest.approx(sum(114 + idx / 2 for idx in range(22) if idx not in (14, 15)) / 20)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_window_matches_brute_force(seed):
+    samples = ride_with_gaps(seed, 500)
+    history = History(load_live_data_dict(), ['engine_rpm'])
+    fill(history, samples)
+
+    rng = random.Random(seed)
+    latest = samples[-1][0]
+    for _ in range(200):
+        end = rng.uniform(samples[0][0], latest)
+        seconds = rng.uniform(0, end - samples[0][0])
+        expected = brute_force(samples, int((end - seconds) // 1), int(end // 1))
+        assert_matches(history.window('engine_rpm', seconds, end), expected)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_window_past_the_finest_rollup_starts_at_a_whole_coarse_bucket(seed):
+    samples = ride_with_gaps(seed, 500)
+    history = History(load_live_data_dict(), ['engine_rpm'], rollups=((1.0, 30), (10.0, 100)))
+    fill(history, samples)
+
+    rng = random.Random(seed)
+    latest = samples[-1][0]
+    finest_oldest = int(latest // 1) - 29
+    for _ in range(200):
+        seconds = rng.uniform(0, latest - samples[0][0])
+        first_bucket = int((latest - seconds) // 1)
+        if first_bucket < finest_oldest:
+            first_bucket = min(-(-first_bucket // 10) * 10, finest_oldest)
+
+        expected = brute_force(samples, first_bucket, int(latest // 1))
+        assert_matches(history.window('engine_rpm', seconds), expected)
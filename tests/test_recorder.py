@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from drivers.ecm import LIVE_DATA_SAMPLE
+from drivers.recorder import FrameLog, FrameRecorder
+
+KEYFRAME_INTERVAL = 8
+
+
+def ride(count: int, seed=0):
+    """:return: (timestamp, frame) pairs where a few bytes change each frame and now and then the length changes"""
+    rng = random.Random(seed)
+    frame = bytearray(LIVE_DATA_SAMPLE)
+    out = []
+    for idx in range(count):
+        for _ in range(rng.randrange(4)):
+            frame[rng.randrange(len(frame))] = rng.randrange(256)
+        if rng.random() < 0.02:
+            frame = bytearray(rng.randbytes(len(frame)))  # so much changed that a key record is smaller
+        out.append((idx * 0.1, bytes(frame[:-1] if idx % 50 == 49 else frame)))
+
+    return out
+
+
+def record(path, frames, close=True, **kwargs):
+    recorder = FrameRecorder(str(path), keyframe_interval=KEYFRAME_INTERVAL, **kwargs)
+    for timestamp, frame in frames:
+        recorder.write(frame, timestamp)
+    if close:
+        recorder.close()
+    else:
+        recorder._file.flush()
+
+    return recorder
+
+
+@pytest.fixture
+def frames():
+    return ride(300)
+
+
+def test_full_replay_matches_what_was_recorded(tmp_path, frames):
+    record(tmp_path / 'ride.rlog', frames)
+    with FrameLog(str(tmp_path / 'ride.rlog')) as log:
+        assert len(log) == len(frames)
+        assert [(frame.timestamp, frame.data) for frame in log] == frames
+        assert [frame.seq for frame in log] == list(range(len(frames)))
+
+
+def test_seeking_across_keyframes_matches_a_full_replay(tmp_path, frames):
+    record(tmp_path / 'ride.rlog', frames)
+    with FrameLog(str(tmp_path / 'ride.rlog')) as log:
+        full = list(log)
+        # every frame, so starts land on keyframes, just after them and just before them
+        for idx, (timestamp, _) in enumerate(frames):
+            assert list(log.frames(timestamp)) == full[idx:]
+            assert list(log.frames(timestamp - 0.05, timestamp + 0.25)) == full[idx:idx + 3]
+
+
+def test_chunks_read_on_their_own_add_up_to_a_full_replay(tmp_path, frames):
+    record(tmp_path / 'ride.rlog', frames)
+    with FrameLog(str(tmp_path / 'ride.rlog')) as log:
+        times = log.chunk_times(20) + [None]
+        chunks = [frame for start, end in zip(times, times[1:]) for frame in log.frames(start, end)]
+        assert chunks == list(log)
+
+
+def test_log_which_wasnt_closed_is_still_readable(tmp_path, frames):
+    recorder = record(tmp_path / 'ride.rlog', frames, close=False)
+    try:
+        with FrameLog(str(tmp_path / 'ride.rlog')) as log:
+            assert [(frame.timestamp, frame.data) for frame in log] == frames
+            assert list(log.frames(frames[100][0])) == list(log)[100:]
+    finally:
+        recorder.close()
+
+
+def test_record_cut_off_part_way_is_dropped(tmp_path, frames):
+    path = tmp_path / 'ride.rlog'
+    recorder = record(path, frames, close=False)
+    recorder._file.close()
+    with open(path, 'r+b') as log_file:
+        log_file.truncate(path.stat().st_size - 1)
+
+    with FrameLog(str(path)) as log:
+        assert [(frame.timestamp, frame.data) for frame in log] == frames[:-1]
+
+
+def test_without_deltas_every_record_is_a_key(tmp_path, frames):
+    record(tmp_path / 'delta.rlog', frames)
+    record(tmp_path / 'key.rlog', frames, delta=False)
+
+    assert (tmp_path / 'delta.rlog').stat().st_size < (tmp_path / 'key.rlog').stat().st_size
+    with FrameLog(str(tmp_path / 'key.rlog')) as log:
+        assert [(frame.timestamp, frame.data) for frame in log] == frames
@@ -0,0 +1,72 @@
+from display import render_loop
+from display.batching import BatchingConnection
+from display.render_loop import COSMETIC, NORMAL, RenderLoop
+
+TICK_PERIOD = 1 / 30
+BYTE_BUDGET = 128
+
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep so that every tick takes no time at all"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+class RecordingConnection:
+    """A serial connection which remembers when each write happened"""
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.writes = []  # (time, bytes)
+
+    def write(self, data: bytes) -> int:
+        self.writes.append((self.clock.now, len(data)))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def test_bytes_per_tick_period_stay_within_the_budget(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(render_loop, 'time', clock)
+    conn = RecordingConnection(clock)
+    display = BatchingConnection(conn)
+
+    loop = RenderLoop(display, lambda: {}, byte_budget=BYTE_BUDGET, tick_period=TICK_PERIOD)
+    for idx in range(2):
+        loop.schedule(f'gauge {idx}', TICK_PERIOD, lambda live_data: display.write(bytes(30)))
+    loop.schedule('slow gauge', 3 * TICK_PERIOD, lambda live_data: display.write(bytes(40)))
+    loop.schedule('label', 3 * TICK_PERIOD, lambda live_data: display.write(bytes(60)), priority=COSMETIC)
+
+    # what an update sends is only known once it has run
+    loop.run(0.5)
+    conn.writes.clear()
+    loop.run(2)
+
+    for start, _ in conn.writes:
+        in_period = sum(size for when, size in conn.writes if start <= when < start + TICK_PERIOD)
+        assert in_period <= BYTE_BUDGET
+    assert loop.updates[-1].deferred > 0
+    assert all(scheduled.runs > 15 for scheduled in loop.updates)
+
+
+def test_ticks_run_as_soon_as_anything_is_due_without_a_tick_period(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(render_loop, 'time', clock)
+    display = BatchingConnection(RecordingConnection(clock))
+
+    loop = RenderLoop(display, lambda: {})
+    loop.schedule('fast', 0.01, lambda live_data: display.write(bytes(1)), priority=NORMAL)
+    loop.schedule('slow', 0.015, lambda live_data: display.write(bytes(1)), priority=NORMAL)
+    loop.run(0.03)
+
+    assert [scheduled.runs for scheduled in loop.updates] == [3, 2]
+    assert loop.ticks == 4
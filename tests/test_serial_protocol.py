@@ -0,0 +1,102 @@
+import pytest
+
+from drivers.exceptions import FailedChecksum, NakResponse, NoResponse
+from drivers.serial_protocol import ECM_ID, NAK, PC_ID, SOH, MessageReader, construct_response, frame_message
+
+FIRST = construct_response(b'first frame')
+SECOND = construct_response(b'second frame')
+
+
+class FakeConn:
+    """Hands out a byte stream in reads of at most chunk bytes, then times out"""
+
+    def __init__(self, data: bytes, chunk=4):
+        self.data = bytearray(data)
+        self.chunk = chunk
+
+    @property
+    def in_waiting(self) -> int:
+        return min(self.chunk, len(self.data))
+
+    def read(self, size: int) -> bytes:
+        size = min(size, self.chunk)
+        out = bytes(self.data[:size])
+        del self.data[:size]
+        return out
+
+
+def corrupt(message: bytes, idx: int) -> bytes:
+    out = bytearray(message)
+    out[idx] ^= 0x40
+    return bytes(out)
+
+
+def read_all(reader: MessageReader) -> list:
+    """:return: every message in the buffer, with errors in place of the ones which failed"""
+    out = []
+    while True:
+        try:
+            message = reader.next_message()
+        except (FailedChecksum, NakResponse) as error:
+            out.append(type(error))
+            continue
+        if message is None:
+            return out
+        out.append(message)
+
+
+def test_corrupted_body_resyncs_on_the_next_frame():
+    reader = MessageReader()
+    reader.feed(corrupt(FIRST, 8) + SECOND)
+
+    with pytest.raises(FailedChecksum):
+        reader.next_message()
+    assert reader.next_message() == b'second frame'
+    assert reader.next_message() is None
+
+
+def test_garbage_and_false_headers_are_skipped():
+    # an SOH byte which doesn't start a valid header, then one whose header looks valid but whose body is cut short
+    garbage = b'\x00\x7f' + bytes([SOH, 0x13, 0x37]) + frame_message(b'\x06cut short', ECM_ID, PC_ID)[:-4]
+    reader = MessageReader()
+    reader.feed(garbage + SECOND)
+
+    assert read_all(reader) == [FailedChecksum, b'second frame']
+
+
+def test_corrupted_size_doesnt_swallow_the_frames_after_it():
+    # the size now claims the message runs on through the next few frames
+    reader = MessageReader()
+    reader.feed(corrupt(FIRST, 3))
+    for _ in range(4):
+        reader.feed(SECOND)
+
+    assert read_all(reader) == [FailedChecksum] + [b'second frame'] * 4
+
+
+def test_byte_at_a_time_matches_all_at_once():
+    stream = b'\x55' + corrupt(FIRST, 10) + FIRST + construct_response(b'', NAK) + b'\x01\x01' + SECOND
+
+    bulk = MessageReader()
+    bulk.feed(stream)
+    expected = read_all(bulk)
+
+    trickle = MessageReader()
+    messages = []
+    for byte in stream:
+        trickle.feed(bytes([byte]))
+        messages += read_all(trickle)
+
+    assert messages == expected == [FailedChecksum, b'first frame', NakResponse, b'second frame']
+
+
+def test_receive_returns_the_next_good_frame_after_a_bad_one():
+    reader = MessageReader()
+    conn = FakeConn(corrupt(FIRST, 8) + SECOND)
+
+    with pytest.raises(FailedChecksum):
+        reader.receive(conn)
+    assert reader.receive(conn) == b'second frame'
+    with pytest.raises(NoResponse):
+        reader.receive(conn)
+    assert reader.bytes_read == len(FIRST) + len(SECOND)